@@ -86,6 +86,13 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Writers take the lock when their transaction starts and queue for
+            # it, instead of failing with "database is locked" when two of them
+            # (e.g. snapshot_worker jobs) try to upgrade a read lock at once
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 
@@ -160,6 +167,97 @@ SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = 'http://localhost:8000/spotify/callback/'  # Adjust as necessary
 CLOUD_API_KEY = os.getenv("CLOUD_API_KEY")
 
+# Concurrent Spotify calls: shared thread pool size and in-flight cap per user
+SPOTIFY_FANOUT_WORKERS = int(os.getenv("SPOTIFY_FANOUT_WORKERS", 32))
+SPOTIFY_FANOUT_PER_USER = int(os.getenv("SPOTIFY_FANOUT_PER_USER", 8))
+
+# Shared keep-alive HTTP pool used for Spotify, token endpoint and Google Translate calls
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))  # hosts kept in the pool
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 32))  # connections per host
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "False") == "True"  # hard per-host limit
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+
+# The default cache holds the locks that keep concurrent token refreshes and
+# analysis generations single-flight, and the results they share. Set
+# REDIS_URL whenever more than one process serves the app: the LocMem
+# fallback is private to each process, so those locks then only hold
+# between threads of the same process.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Per-user Spotify response cache: 'lru' (in-process), 'django' (CACHES alias) or 'redis'
+SPOTIFY_CACHE_BACKEND = os.getenv("SPOTIFY_CACHE_BACKEND", "lru")
+SPOTIFY_CACHE_OPTIONS = {"url": REDIS_URL or "redis://localhost:6379/0"} if SPOTIFY_CACHE_BACKEND == "redis" else {}
+SPOTIFY_CACHE_TTLS = {}  # overrides for users.spotify_cache.DEFAULT_TTLS, e.g. {'me/top/': 3600}
+SPOTIFY_CACHE_STALE_SECONDS = 60 * 60 * 24  # how long stale entries are kept for ETag revalidation
+
+# Rows per INSERT statement when a snapshot's child rows are bulk-created
+SNAPSHOT_BATCH_SIZE = 500
+
+# Save a capture identical to the user's previous one of the same type as a
+# pointer to it instead of a second copy of every row
+SNAPSHOT_DEDUPE = os.getenv("SNAPSHOT_DEDUPE", "True") == "True"
+
+# Accounts with more snapshots than this are deleted in the background, on
+# ACCOUNT_DELETE_WORKERS threads, ACCOUNT_DELETE_BATCH_SIZE snapshots per
+# transaction; `manage.py finish_account_deletions` completes interrupted ones
+ACCOUNT_DELETE_BACKGROUND_THRESHOLD = 1000
+ACCOUNT_DELETE_BATCH_SIZE = 1000
+ACCOUNT_DELETE_WORKERS = 1
+
+# History kept by `manage.py compact_wraps`, per wrapper type ('default' for
+# the rest). Public wraps are always kept; private ones older than
+# keep_all_days are thinned to the newest per 'day', 'week' or 'month'
+# (thin_to None deletes them)
+SNAPSHOT_RETENTION = {
+    'default': {'keep_all_days': 90, 'thin_to': 'week'},
+    'RECENTLY_PLAYED': {'keep_all_days': 30, 'thin_to': 'day'},
+}
+
+# How many items snapshot capture pages through, None meaning everything
+# (see users.spotify_wrapper.DEFAULT_CAPTURE_LIMITS)
+SPOTIFY_CAPTURE_LIMITS = {
+    'recently_played': 50,
+    'top_items': 50,
+    'playlists': 50,
+    'playlist_tracks': None,
+}
+
+# Access tokens within the skew window count as expired; inside the
+# refresh-ahead window they are still used but renewed in the background
+SPOTIFY_TOKEN_SKEW_SECONDS = 60
+SPOTIFY_TOKEN_REFRESH_AHEAD_SECONDS = 600
+SPOTIFY_TOKEN_MAX_RETRIES = 3
+
+# Spotify API pacing: requests/second and burst size for the whole app, plus
+# how 429 responses are retried. Spotify limits per app, so there is no
+# per-user pacing unless SPOTIFY_USER_RATE is set; keep it and its burst well
+# above SPOTIFY_FANOUT_PER_USER, a cold dashboard makes one call per playlist
+SPOTIFY_APP_RATE = 20
+SPOTIFY_APP_BURST = 40
+SPOTIFY_USER_RATE = None
+SPOTIFY_USER_BURST = None  # twice the rate when unset
+SPOTIFY_RATE_LIMIT_RETRIES = 3
+SPOTIFY_RATE_LIMIT_MAX_WAIT = 30  # seconds; longer Retry-After values are not waited out
+
+# Jobs run at once by `manage.py snapshot_worker` (override with --concurrency),
+# and how many times a job that hits a database error is run before it fails
+SNAPSHOT_WORKER_CONCURRENCY = 4
+SNAPSHOT_JOB_MAX_ATTEMPTS = 3
+
+# Seconds a user's DashboardAggregate is served before it is recomputed from Spotify
+DASHBOARD_AGGREGATE_TTL = 60 * 5
+
+# Top tracks and artists per time range shown on the dashboard
+DASHBOARD_TOP_ITEMS = 10
+
+# Wraps per page of the public feed
+PUBLIC_FEED_PAGE_SIZE = 20
+
 
 LOGIN_URL = 'login'
 from django.utils.translation import gettext_lazy as _
@@ -178,3 +276,23 @@ LANGUAGE_CODE = 'en'
 LOCALE_PATHS = [
     os.path.join(BASE_DIR, 'locale'),  # Path to the locale directory
 ]
+
+# Machine translations: in-process LRU size in front of the users.Translation
+# table, and strings sent per Google Translate request (at most 128)
+TRANSLATION_CACHE_SIZE = 2000
+TRANSLATION_BATCH_SIZE = 100
+
+# Where uncached strings are translated: 'google', 'local' (the stand-in run by
+# `manage.py translation_standin`), 'dict' (in-process, deterministic) or a dotted
+# path. The offline ones return fake translations, which are cached under their
+# own namespace and so never served once the real backend is back.
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google")
+TRANSLATION_BACKEND_OPTIONS = {}  # e.g. {'url': 'http://127.0.0.1:9000/language/translate/v2'} for 'local'
+
+# LLM music taste analysis: model, how long results are cached per
+# (track set, language), and how long concurrent requests wait on one generation
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gemini-pro")
+ANALYSIS_CACHE_TTL = 60 * 60 * 24
+ANALYSIS_LOCK_TIMEOUT = 60
+ANALYSIS_RETRY_AFTER = 60  # seconds a failed generation is reported before it is retried
+ANALYSIS_WORKERS = 2  # background generations run at once per process
@@ -0,0 +1,106 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from .models import User, delete_account
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+# Progress stays readable for a while after the deletion finishes
+_PROGRESS_TTL = 60 * 60
+# Deletion ids are the user id, signed with this salt
+_ID_SALT = 'users.account_deletion'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The pool background deletions run on. One worker by default: deletions
+    are long and write-heavy, and they shouldn't take workers from the
+    Spotify fan-out pool.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ACCOUNT_DELETE_WORKERS', 1),
+                    thread_name_prefix='account-deletion',
+                )
+    return _executor
+
+
+def _progress_key(deletion_id):
+    return f'account_deletion:{deletion_id}'
+
+
+def _report(deletion_id, status, deleted, total):
+    cache.set(_progress_key(deletion_id), {'status': status, 'deleted': deleted, 'total': total}, _PROGRESS_TTL)
+
+
+def is_large(user):
+    """Whether deleting ``user`` inline would keep the request waiting too long."""
+    return user.spotify_data.count() > getattr(settings, 'ACCOUNT_DELETE_BACKGROUND_THRESHOLD', 1000)
+
+
+def _run(user_id, deletion_id, total):
+    try:
+        delete_account(
+            User.objects.get(id=user_id),
+            progress=lambda deleted, total: _report(deletion_id, 'running', deleted, total)
+        )
+        _report(deletion_id, 'done', total, total)
+    except Exception as e:
+        # The account stays deactivated and marked, finish_account_deletions picks up where this stopped
+        logger.error(f"Deleting account {user_id} failed: {str(e)}")
+        _report(deletion_id, 'failed', 0, total)
+    finally:
+        connections.close_all()
+
+
+def start(user):
+    """
+    Deactivate ``user`` and delete the account in the background; returns
+    an id to poll ``progress`` with. The request is recorded on the user, so
+    it survives a restart of this process.
+    """
+    User.objects.filter(id=user.id).update(is_active=False, deletion_requested_at=timezone.now())
+
+    deletion_id = signing.dumps(user.id, salt=_ID_SALT)
+    total = user.spotify_data.count()
+    _report(deletion_id, 'pending', 0, total)
+    get_executor().submit(_run, user.id, deletion_id, total)
+    return deletion_id
+
+
+def progress(deletion_id):
+    """
+    {'status', 'deleted', 'total'} of a background deletion, or None if
+    there is no such deletion.
+
+    Whether it is still under way comes from the user row, so any worker
+    can answer, also after a restart. The counts are only known to the
+    cache the deleting process reports to, and are None without it.
+    """
+    try:
+        user_id = signing.loads(deletion_id, salt=_ID_SALT)
+    except signing.BadSignature:
+        return None
+
+    reported = cache.get(_progress_key(deletion_id)) or {'status': 'running', 'deleted': None, 'total': None}
+    row = User.objects.filter(id=user_id).values('deletion_requested_at').first()
+    if row is None:
+        # The user row is the last thing deleted
+        return {**reported, 'status': 'done', 'deleted': reported['total']}
+    if row['deletion_requested_at'] is None:
+        return None
+    return reported
@@ -0,0 +1,112 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_user_slots = {}
+_user_slots_lock = threading.Lock()
+# The per-user slot the current pool thread holds, see released_slot()
+_held = threading.local()
+
+
+def get_executor():
+    """
+    Return the process-wide thread pool used for Spotify fan-out.
+    The pool is created lazily so management commands that never fan out
+    don't spawn threads.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SPOTIFY_FANOUT_WORKERS', 32),
+                    thread_name_prefix='spotify-fanout',
+                )
+    return _executor
+
+
+def _user_semaphore(user_id):
+    """Get (or create) the semaphore capping in-flight requests for one user."""
+    with _user_slots_lock:
+        semaphore = _user_slots.get(user_id)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(
+                getattr(settings, 'SPOTIFY_FANOUT_PER_USER', 8)
+            )
+            _user_slots[user_id] = semaphore
+        return semaphore
+
+
+@contextmanager
+def released_slot():
+    """
+    Give the calling thread's per-user fan-out slot back for the duration of
+    the block, e.g. while it sleeps off a rate limit, so the user's other
+    calls aren't queued behind a thread that isn't doing anything. A no-op
+    outside fan-out threads.
+    """
+    semaphore = getattr(_held, 'semaphore', None)
+    if semaphore is None:
+        yield
+        return
+
+    semaphore.release()
+    _held.semaphore = None
+    try:
+        yield
+    finally:
+        semaphore.acquire()
+        _held.semaphore = semaphore
+
+
+class FanOut:
+    """
+    Run independent Spotify calls for a single user concurrently.
+
+    Calls are submitted under a key and collected with ``results()``, which
+    returns a dict of key -> return value. A call that raises is logged and
+    resolves to its ``default`` so one failed endpoint doesn't take down the
+    whole page, matching the old sequential "empty list on error" behaviour.
+    Its key is added to ``failed``, for callers that must not mistake the
+    default for a real result.
+    """
+
+    def __init__(self, user_id):
+        self.semaphore = _user_semaphore(user_id)
+        self.futures = {}
+        self.defaults = {}
+        self.failed = []
+
+    def _run(self, fn, args, kwargs):
+        with self.semaphore:
+            _held.semaphore = self.semaphore
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _held.semaphore = None
+
+    def submit(self, key, fn, *args, default=None, **kwargs):
+        self.futures[key] = get_executor().submit(self._run, fn, args, kwargs)
+        self.defaults[key] = default
+        return self
+
+    def results(self):
+        results = {}
+        for key, future in self.futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                logger.error(f"Fan-out call {key!r} failed: {str(e)}")
+                results[key] = self.defaults[key]
+                self.failed.append(key)
+        self.futures = {}
+        self.defaults = {}
+        return results
@@ -0,0 +1,62 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """Create a keep-alive session whose connection pools follow the HTTP_POOL settings."""
+    adapter = HTTPAdapter(
+        # Number of distinct hosts whose pools are kept around
+        pool_connections=getattr(settings, 'HTTP_POOL_CONNECTIONS', 10),
+        # Connections kept alive per host
+        pool_maxsize=getattr(settings, 'HTTP_POOL_MAXSIZE', 32),
+        # When True, callers wait for a free connection instead of opening
+        # throwaway ones, which turns pool_maxsize into a hard per-host limit
+        pool_block=getattr(settings, 'HTTP_POOL_BLOCK', False),
+        max_retries=0,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session shared by every outbound call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def default_timeout():
+    """(connect, read) timeout applied when the caller doesn't pass one."""
+    return (
+        getattr(settings, 'HTTP_CONNECT_TIMEOUT', 3.05),
+        getattr(settings, 'HTTP_READ_TIMEOUT', 10),
+    )
+
+
+def request(method, url, **kwargs):
+    """Drop-in replacement for ``requests.request`` that goes through the shared pool."""
+    kwargs.setdefault('timeout', default_timeout())
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, params=None, **kwargs):
+    return request('GET', url, params=params, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
@@ -0,0 +1,93 @@
+import re
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from users.models import SnapshotJob, User, rendered_children, wrap_lookup
+from users.views import encode_feed_cursor, public_feed, user_wraps
+
+
+def hot_queries():
+    """
+    The querysets behind the busiest pages, built by the same helpers the
+    views use, with placeholder parameters (plans don't depend on them).
+    Each comes with whether it has to be a bounded search: keyset pages and
+    lookups must seek into an index, not walk it from one end.
+    """
+    now = timezone.now()
+    user = User(id=0)
+    page_size = getattr(settings, 'PUBLIC_FEED_PAGE_SIZE', 20)
+    later_page = encode_feed_cursor(SimpleNamespace(created_at=now, id=0))
+    return {
+        'wraps page': (user_wraps(user), True),
+        'public feed, first page': (public_feed()[:page_size + 1], False),
+        'public feed, later page': (public_feed(later_page)[:page_size + 1], True),
+        'delete / publish lookup': (wrap_lookup(user, 'TOP_ARTISTS', now), True),
+        'wrap children': (rendered_children('tracks').filter(spotify_data__in=[0]), True),
+        'snapshot queue': (SnapshotJob.queued()[:4], True),
+    }
+
+
+def scans(plan, bounded):
+    """
+    Tables the plan reads too much of, for the backends we run on: any
+    whole table, and for ``bounded`` queries also any index walked without
+    a search condition.
+    """
+    if connection.vendor == 'postgresql':
+        scanned = re.findall(r'Seq Scan on (\w+)', plan)
+        if bounded:
+            # An index scan lists its search condition under its own node
+            for node in re.split(r'\n\s*->\s+', plan):
+                match = re.match(r'\s*Index (?:Only )?Scan (?:Backward )?using \w+ on (\w+)', node)
+                if match and 'Index Cond' not in node:
+                    scanned.append(match.group(1))
+        return scanned
+    if connection.vendor == 'sqlite':
+        # "SEARCH t USING INDEX i (a=?)" seeks into the index; "SCAN t USING
+        # INDEX i" walks all of it, and a bare "SCAN t" reads the whole table
+        if bounded:
+            return re.findall(r'\bSCAN (?:TABLE )?(\w+)', plan)
+        return re.findall(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?:$|\s)', plan, re.MULTILINE)
+    if connection.vendor == 'mysql':
+        # "index" is a full index scan, "range", "ref" and "const" are searches
+        unbounded = {'ALL', 'index'} if bounded else {'ALL'}
+        return [table for table, access in re.findall(r'"table_name": "(\w+)".*?"access_type": "(\w+)"', plan, re.S)
+                if access in unbounded]
+    raise CommandError(f"Don't know how to read {connection.vendor} query plans")
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot SpotifyData queries and fail if any of them scans more than it has to'
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if connection.vendor == 'mysql':
+            explain_options['format'] = 'json'
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny dev tables make sequential scans look cheapest, ask whether an index *can* be used
+                cursor.execute('SET enable_seqscan = off')
+
+            failures = []
+            for name, (queryset, bounded) in hot_queries().items():
+                plan = queryset.explain(**explain_options)
+                scanned = scans(plan, bounded)
+                if scanned:
+                    failures.append(name)
+                    kind = 'unbounded scan' if bounded else 'full scan'
+                    self.stdout.write(self.style.ERROR(f"{name}: {kind} of {', '.join(scanned)}"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"{name}: OK"))
+                if scanned or options['verbosity'] > 1:
+                    self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+
+            if connection.vendor == 'postgresql':
+                cursor.execute('RESET enable_seqscan')
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries scan more than they have to: {', '.join(failures)}")
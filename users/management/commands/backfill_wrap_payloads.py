@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from users.models import SpotifyData, prefetch_wraps
+
+
+class Command(BaseCommand):
+    help = 'Store the denormalized payload on snapshots saved without one (or with an outdated version)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of snapshots to load and update per batch',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many snapshots need a payload',
+        )
+
+    def handle(self, *args, **options):
+        # Repeated captures have no payload of their own, they render their source's
+        pending = SpotifyData.objects.filter(
+            Q(payload__isnull=True) | ~Q(payload_version=SpotifyData.PAYLOAD_VERSION),
+            source__isnull=True
+        ).order_by('id')
+
+        total = pending.count()
+        if options['dry_run']:
+            self.stdout.write(f"{total} snapshots need a payload")
+            return
+
+        done = 0
+        last_id = 0
+        while True:
+            # Walk by id so rows updated in earlier batches aren't revisited
+            batch = list(pending.filter(id__gt=last_id).only('id', 'wrapper_type', 'source')[:options['batch_size']])
+            if not batch:
+                break
+
+            # Cleared first so prefetch_wraps loads the children of every row
+            for entry in batch:
+                entry.payload = None
+            prefetch_wraps(batch)
+
+            for entry in batch:
+                entry.payload = entry.build_payload()
+                entry.payload_version = SpotifyData.PAYLOAD_VERSION
+            SpotifyData.objects.bulk_update(batch, ['payload', 'payload_version'])
+
+            done += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Backfilled {done}/{total} snapshots")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled payloads for {done} snapshots"))
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+from users import translator
+
+
+class Command(BaseCommand):
+    help = 'Drive synthetic load through the translation layer and report throughput and cache hit rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Simulated page renders')
+        parser.add_argument('--concurrency', type=int, default=8, help='Renders in flight at once')
+        parser.add_argument('--strings', type=int, default=20, help='Strings translated per render')
+        parser.add_argument(
+            '--vocabulary',
+            type=int,
+            default=500,
+            help='Distinct strings the renders draw from; smaller means more cache hits',
+        )
+        parser.add_argument('--language', default='es')
+        parser.add_argument(
+            '--backend',
+            choices=[*translator.BACKENDS, 'configured'],
+            default='dict',
+            help="Backend to translate misses with; 'configured' uses TRANSLATION_BACKEND, which may be live Google",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            self.stderr.write("Nothing to do with --requests below 1")
+            return
+
+        name = options['backend']
+        if name == 'configured':
+            backend = translator.get_backend()
+        else:
+            # The configured options only apply to the backend they were written for
+            configured = getattr(settings, 'TRANSLATION_BACKEND', 'google') == name
+            backend = translator.BACKENDS[name](**(getattr(settings, 'TRANSLATION_BACKEND_OPTIONS', {}) if configured else {}))
+        self.stdout.write(f"Backend: {type(backend).__name__}")
+
+        with translator.using_backend(backend):
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        rng = random.Random(options['seed'])
+        vocabulary = [f'benchmark string {i}' for i in range(options['vocabulary'])]
+        pages = [rng.sample(vocabulary, min(options['strings'], len(vocabulary))) for _ in range(options['requests'])]
+
+        before = translator.metrics()
+        latencies = []
+
+        def render(texts):
+            started = time.perf_counter()
+            try:
+                translator.translate_many(texts, options['language'])
+            finally:
+                connections.close_all()
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(render, pages))
+        elapsed = time.perf_counter() - started
+
+        after = translator.metrics()
+        delta = {name: after[name] - before[name] for name in before if name != 'hit_rate'}
+        lookups = delta['catalog_hits'] + delta['memory_hits'] + delta['db_hits'] + delta['misses']
+        latencies.sort()
+
+        self.stdout.write(f"Renders: {len(pages)} in {elapsed:.2f}s ({len(pages) / elapsed:.1f}/s)")
+        self.stdout.write(f"Strings: {lookups} ({lookups / elapsed:.1f}/s)")
+        self.stdout.write(
+            f"Latency: p50 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms"
+        )
+        self.stdout.write(
+            f"Hits: memory {delta['memory_hits']}, database {delta['db_hits']}, catalog {delta['catalog_hits']}; "
+            f"misses {delta['misses']} ({(lookups - delta['misses']) / lookups if lookups else 0:.1%} hit rate)"
+        )
+        self.stdout.write(
+            f"Upstream: {delta['upstream_requests']} requests, {delta['upstream_errors']} errors"
+        )
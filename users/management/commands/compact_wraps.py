@@ -0,0 +1,252 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from collections import Counter
+from datetime import timedelta
+import time
+
+from users.models import (
+    Album, Artist, CatalogAlbum, CatalogArtist, CatalogTrack, Genre, Playlist, SpotifyData, Track,
+    delete_snapshots
+)
+
+# Private snapshots past keep_all_days are thinned to the newest one per bucket
+BUCKETS = {
+    'day': lambda moment: moment.date(),
+    'week': lambda moment: moment.isocalendar()[:2],
+    'month': lambda moment: (moment.year, moment.month),
+}
+
+SNAPSHOT_MODELS = [SpotifyData, Track, Artist, Album, Genre, Playlist]
+CATALOG_MODELS = [CatalogTrack, CatalogArtist, CatalogAlbum]
+
+
+def retention_policy(wrapper_type):
+    """SNAPSHOT_RETENTION for ``wrapper_type``, falling back to its 'default' entry."""
+    policies = getattr(settings, 'SNAPSHOT_RETENTION', {})
+    policy = {'keep_all_days': 90, 'thin_to': 'week', **policies.get('default', {}), **policies.get(wrapper_type, {})}
+    if policy['thin_to'] is not None and policy['thin_to'] not in BUCKETS:
+        raise CommandError(f"Unknown thin_to {policy['thin_to']!r} for {wrapper_type}, use one of {', '.join(BUCKETS)}")
+    return policy
+
+
+def expired_snapshots(wrapper_type, policy, now):
+    """
+    Ids of the private ``wrapper_type`` snapshots the policy lets go, one
+    list per user, newest first.
+    """
+    candidates = SpotifyData.objects.filter(
+        wrapper_type=wrapper_type,
+        is_public=False,
+        created_at__lt=now - timedelta(days=policy['keep_all_days'])
+    )
+    bucket = BUCKETS[policy['thin_to']] if policy['thin_to'] else None
+
+    for user_id in candidates.order_by('user_id').values_list('user_id', flat=True).distinct():
+        kept = set()
+        expired = []
+        rows = candidates.filter(user_id=user_id).order_by('-created_at', '-id').values_list('id', 'created_at')
+        for snapshot_id, created_at in rows:
+            key = bucket(timezone.localtime(created_at)) if bucket else None
+            if bucket and key not in kept:
+                kept.add(key)
+            else:
+                expired.append(snapshot_id)
+        if expired:
+            yield expired
+
+
+def table_bytes(model):
+    """Space taken by the model's table, or None where the backend can't tell."""
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT pg_total_relation_size(%s)', [table]),
+        'mysql': (
+            'SELECT data_length + index_length FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s',
+            [table]
+        ),
+        # Needs SQLite built with the dbstat virtual table
+        'sqlite': ('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = 'Thin out old private wraps according to SNAPSHOT_RETENTION and report the space reclaimed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Snapshots deleted per transaction, to keep locks short',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to wait between batches, to leave room for other writers',
+        )
+        parser.add_argument(
+            '--type',
+            action='append',
+            dest='wrapper_types',
+            choices=[code for code, label in SpotifyData.WRAPPER_TYPES],
+            help='Only compact these wrapper types (repeatable)',
+        )
+        parser.add_argument(
+            '--prune-catalog',
+            action='store_true',
+            help='Also delete catalog tracks, artists and albums no snapshot refers to anymore',
+        )
+        parser.add_argument(
+            '--catalog-grace-minutes',
+            type=float,
+            default=60,
+            help='Only prune catalog rows no capture has used for this long',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, compacting again every this many seconds (for a scheduled worker)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        while True:
+            self.compact(options)
+            if not options['interval']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+
+    def compact(self, options):
+        started = time.perf_counter()
+        now = timezone.now()
+        wrapper_types = options['wrapper_types'] or [code for code, label in SpotifyData.WRAPPER_TYPES]
+
+        # Average row sizes are taken before deleting anything, to estimate the bytes freed
+        row_bytes = {}
+        for model in SNAPSHOT_MODELS + (CATALOG_MODELS if options['prune_catalog'] else []):
+            size, rows = table_bytes(model), model.objects.count()
+            row_bytes[model._meta.label] = size / rows if size and rows else None
+
+        deleted = Counter()
+        counted = set()
+        for wrapper_type in wrapper_types:
+            policy = retention_policy(wrapper_type)
+            before = deleted[SpotifyData._meta.label]
+            for expired in expired_snapshots(wrapper_type, policy, now):
+                for start in range(0, len(expired), options['batch_size']):
+                    batch = expired[start:start + options['batch_size']]
+                    deleted.update(self.count_batch(batch, counted) if options['dry_run'] else self.delete_batch(batch))
+                    if options['pause'] and not options['dry_run']:
+                        time.sleep(options['pause'])
+            self.stdout.write(
+                f"{wrapper_type}: {deleted[SpotifyData._meta.label] - before} snapshots "
+                f"(keep {policy['keep_all_days']} days, then {policy['thin_to'] or 'nothing'})"
+            )
+
+        if options['prune_catalog']:
+            for model in CATALOG_MODELS:
+                deleted[model._meta.label] += self.prune_catalog(model, options)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        total_bytes = 0
+        unknown = False
+        for label, count in sorted(deleted.items()):
+            if not count:
+                continue
+            estimate = row_bytes.get(label)
+            if estimate is None:
+                unknown = True
+                self.stdout.write(f"{verb} {count} {label} rows")
+            else:
+                total_bytes += count * estimate
+                self.stdout.write(f"{verb} {count} {label} rows (~{format_bytes(count * estimate)})")
+
+        summary = f"{sum(deleted.values())} rows, ~{format_bytes(total_bytes)}"
+        if unknown:
+            summary += " (sizes unavailable for some tables)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {summary} in {time.perf_counter() - started:.2f}s"
+        ))
+
+    def handed_over(self, ids, gone):
+        """Snapshots among ``ids`` with a repeat outside ``gone``, which keeps their children."""
+        return SpotifyData.objects.filter(
+            id__in=SpotifyData.objects.filter(source_id__in=ids).exclude(id__in=gone).values('source_id')
+        )
+
+    def delete_batch(self, ids):
+        """Delete one batch of snapshots with their children; returns rows deleted per model."""
+        with transaction.atomic():
+            # A kept capture repeating one of these inherits its content first
+            for source in self.handed_over(ids, ids):
+                source.hand_over_repeats(exclude=ids)
+
+            return delete_snapshots(SpotifyData.objects.filter(id__in=ids))
+
+    def count_batch(self, ids, counted):
+        """
+        What delete_batch would remove, without deleting it. ``counted`` holds
+        the snapshots of earlier batches, which a real run has deleted by now.
+        """
+        counted.update(ids)
+        handed_over = self.handed_over(ids, counted).values('id')
+        counts = {SpotifyData._meta.label: len(ids)}
+        for relation in SpotifyData.RENDERED_FIELDS:
+            model = SpotifyData._meta.get_field(relation).related_model
+            counts[model._meta.label] = model.objects.filter(
+                spotify_data_id__in=ids
+            ).exclude(spotify_data_id__in=handed_over).count()
+        return counts
+
+    def prune_catalog(self, model, options):
+        """
+        Delete catalog rows no snapshot refers to. Rows a capture upserted
+        within --catalog-grace-minutes are left alone: the capture's
+        transaction may not have inserted the rows pointing at them yet.
+        """
+        orphans = model.objects.filter(
+            appearances__isnull=True,
+            last_seen_at__lt=timezone.now() - timedelta(minutes=options['catalog_grace_minutes'])
+        )
+        if options['dry_run']:
+            return orphans.count()
+
+        pruned = 0
+        while True:
+            ids = list(orphans.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                return pruned
+            pruned += orphans.filter(id__in=ids).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
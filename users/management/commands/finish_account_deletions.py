@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+import time
+
+from users.models import User, delete_account
+
+
+class Command(BaseCommand):
+    help = 'Finish background account deletions that were interrupted, e.g. by a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=float,
+            default=30,
+            help='Leave deletions requested more recently than this to the process running them',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the accounts still pending deletion',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running, checking again every this many seconds (for a scheduled worker)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.finish(options)
+            if not options['interval']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+
+    def finish(self, options):
+        pending = User.objects.filter(
+            deletion_requested_at__lt=timezone.now() - timedelta(minutes=options['grace_minutes'])
+        ).order_by('deletion_requested_at')
+
+        finished = 0
+        for user in pending:
+            label = f"{user.username} (requested {user.deletion_requested_at:%Y-%m-%d %H:%M})"
+            if options['dry_run']:
+                self.stdout.write(f"Pending: {label}")
+                continue
+
+            started = time.perf_counter()
+            try:
+                delete_account(
+                    user,
+                    progress=lambda deleted, total: self.stdout.write(f"  {label}: {deleted}/{total} snapshots")
+                )
+            except Exception as e:
+                self.stderr.write(f"Error deleting {label}: {e}")
+                continue
+            finished += 1
+            self.stdout.write(f"Deleted {label} in {time.perf_counter() - started:.2f}s")
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Finished {finished} account deletions"))
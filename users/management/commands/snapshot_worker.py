@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import time
+
+from users.models import SnapshotJob
+
+
+class Command(BaseCommand):
+    help = 'Run queued Spotify snapshot captures in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'SNAPSHOT_WORKER_CONCURRENCY', 4),
+            help='Number of jobs to run at the same time',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between checks for new jobs',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Requeue jobs that have been RUNNING for this many seconds (left over by a dead worker)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for more jobs',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+
+        stale = SnapshotJob.objects.filter(
+            status='RUNNING',
+            started_at__lt=timezone.now() - timedelta(seconds=options['stale_after'])
+        ).update(status='QUEUED', started_at=None)
+        if stale:
+            self.stdout.write(f"Requeued {stale} stale jobs")
+
+        self.stdout.write(f"Snapshot worker started with concurrency {concurrency}")
+
+        in_flight = {}  # future -> job id
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='snapshot-worker') as pool:
+            try:
+                while True:
+                    for future in [f for f in in_flight if f.done()]:
+                        in_flight.pop(future)
+
+                    job_ids = []
+                    free = concurrency - len(in_flight)
+                    if free > 0:
+                        job_ids = list(
+                            SnapshotJob.queued()
+                            .exclude(id__in=in_flight.values())
+                            .values_list('id', flat=True)[:free]
+                        )
+                        for job_id in job_ids:
+                            in_flight[pool.submit(self.run_job, job_id)] = job_id
+
+                    if options['once'] and not job_ids and not in_flight:
+                        break
+                    if not job_ids:
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping, waiting for running jobs to finish...")
+
+        self.stdout.write(self.style.SUCCESS("Snapshot worker stopped"))
+
+    def run_job(self, job_id):
+        try:
+            job = SnapshotJob.objects.select_related('user').get(id=job_id)
+            if not job.claim():
+                return
+
+            started = time.perf_counter()
+            job.run()
+            self.stdout.write(
+                f"Job {job.id} ({job.user.username}, {job.wrapper_type}): "
+                f"{job.status} in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            self.stderr.write(f"Error running job {job_id}: {e}")
+        finally:
+            connections.close_all()
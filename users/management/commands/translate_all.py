@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-import requests
+from django.db import connections
+from users import translator
+from concurrent.futures import ThreadPoolExecutor
 import polib
 import os
 from pathlib import Path
 import subprocess
 import sys
+import time
 
 
 class Command(BaseCommand):
@@ -16,16 +20,36 @@ class Command(BaseCommand):
             action='store_true',
             help='Force regeneration of .po files',
         )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be translated without calling the API or writing any files',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=getattr(settings, 'TRANSLATION_BATCH_SIZE', 100),
+            help='Strings sent per Translate API request (at most 128)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Translate API requests in flight at once, across all languages',
+        )
 
     def handle(self, *args, **options):
-        try:
-            from django.conf import settings
-            api_key = settings.CLOUD_API_KEY
-        except Exception as e:
-            self.stderr.write(f"Error loading settings: {str(e)}")
+        if not getattr(settings, 'CLOUD_API_KEY', None) and not options['dry_run']:
+            self.stderr.write("CLOUD_API_KEY is not set")
+            return
+        if isinstance(translator.get_backend(), (translator.LocalBackend, translator.DictBackend)) and not options['dry_run']:
+            # Their pseudo-translations would end up in the .po files
+            self.stderr.write("TRANSLATION_BACKEND is an offline stand-in, refusing to write its output to the catalogs")
             return
 
         languages = ['es', 'fr']
+        batch_size = min(options['batch_size'], translator.MAX_BATCH_SIZE)
+        started = time.perf_counter()
 
         # Get the base directory
         base_dir = Path(settings.BASE_DIR)
@@ -34,6 +58,7 @@ class Command(BaseCommand):
         # Ensure locale directory exists
         locale_dir.mkdir(exist_ok=True)
 
+        catalogs = {}  # language -> (po file, entries still to translate)
         for lang in languages:
             self.stdout.write(f"\nProcessing {lang}...")
 
@@ -43,7 +68,7 @@ class Command(BaseCommand):
 
             po_path = lang_dir / 'django.po'
 
-            if options['regenerate'] or not po_path.exists():
+            if (options['regenerate'] or not po_path.exists()) and not options['dry_run']:
                 self.stdout.write(f"Generating .po file for {lang}...")
 
                 try:
@@ -72,41 +97,49 @@ class Command(BaseCommand):
                 self.stderr.write(f"Error reading .po file: {e}")
                 continue
 
-            untranslated_count = len(po.untranslated_entries())
-            if untranslated_count == 0:
+            entries = [entry for entry in po.untranslated_entries() if entry.msgid and not entry.obsolete]
+            if not entries:
                 self.stdout.write(f"No untranslated strings found for {lang}")
                 continue
 
-            self.stdout.write(f"Found {untranslated_count} untranslated strings")
+            # Strings translated on an earlier run are filled in from the cache and never resent
+            cached = translator.cached_translations([entry.msgid for entry in entries], lang, format='html')
+            to_send = len({entry.msgid for entry in entries} - set(cached))
+            self.stdout.write(
+                f"Found {len(entries)} untranslated strings, {len(entries) - to_send} cached, "
+                f"{to_send} to send in {-(-to_send // batch_size)} requests"
+            )
+            catalogs[lang] = (po, entries)
 
-            for entry in po.untranslated_entries():
-                if not entry.msgid:
-                    continue
+        if options['dry_run'] or not catalogs:
+            return
 
+        # Every (language, batch) pair goes through one bounded pool, so
+        # languages are translated side by side as well as batch by batch
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='translate') as pool:
+            futures = {
+                lang: [
+                    pool.submit(self.translate_batch, entries[start:start + batch_size], lang)
+                    for start in range(0, len(entries), batch_size)
+                ]
+                for lang, (po, entries) in catalogs.items()
+            }
+
+            translated_count = 0
+            for lang, (po, entries) in catalogs.items():
+                translated_count += sum(future.result() for future in futures[lang])
                 try:
-                    url = f"https://translation.googleapis.com/language/translate/v2?key={api_key}"
-                    data = {
-                        'q': entry.msgid,
-                        'target': lang,
-                        'format': 'html'
-                    }
-                    response = requests.post(url, data=data)
-                    response.raise_for_status()
-
-                    translated_text = response.json()['data']['translations'][0]['translatedText']
-                    entry.msgstr = translated_text
-                    self.stdout.write(f'Translated: {entry.msgid} → {entry.msgstr}')
-
+                    po.save()
+                    self.stdout.write(f"Saved translations for {lang}")
                 except Exception as e:
-                    self.stderr.write(f"Error translating '{entry.msgid}': {e}")
+                    self.stderr.write(f"Error saving .po file: {e}")
                     continue
 
-            try:
-                po.save()
-                self.stdout.write(f"Saved translations for {lang}")
-            except Exception as e:
-                self.stderr.write(f"Error saving .po file: {e}")
-                continue
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Translated {translated_count} strings in {elapsed:.2f}s "
+            f"({translated_count / elapsed if elapsed else 0:.1f} strings/s)"
+        )
 
         try:
             subprocess.run([
@@ -116,4 +149,24 @@ class Command(BaseCommand):
             ], check=True)
             self.stdout.write(self.style.SUCCESS("\nTranslations completed and compiled!"))
         except subprocess.CalledProcessError as e:
-            self.stderr.write(f"Error compiling messages: {e}")
\ No newline at end of file
+            self.stderr.write(f"Error compiling messages: {e}")
+
+    def translate_batch(self, entries, lang):
+        """Fill in one batch of entries; returns how many got a translation."""
+        try:
+            translations = translator.translate_many(
+                [entry.msgid for entry in entries], lang, format='html', batch_size=len(entries)
+            )
+        finally:
+            connections.close_all()
+
+        count = 0
+        for entry, translated_text in zip(entries, translations):
+            # translate_many hands back None when the API call failed
+            if translated_text is None:
+                self.stderr.write(f"Error translating '{entry.msgid}'")
+                continue
+            entry.msgstr = translated_text
+            count += 1
+            self.stdout.write(f'Translated: {entry.msgid} → {entry.msgstr}')
+        return count
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import json
+import time
+
+from users.translator import pseudo_translate
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Google Translate v2 API with deterministic responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=0,
+            help='Delay added to every response, to mimic the real API',
+        )
+
+    def handle(self, *args, **options):
+        latency = options['latency_ms'] / 1000
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                params = {**parse_qs(urlsplit(self.path).query), **parse_qs(body)}
+                target = params.get('target', ['xx'])[0]
+
+                if latency:
+                    time.sleep(latency)
+
+                payload = json.dumps({'data': {'translations': [
+                    {'translatedText': pseudo_translate(text, target)} for text in params.get('q', [])
+                ]}}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # One line per request would drown out a load test
+                pass
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f"Translation stand-in listening on http://{options['host']}:{options['port']}/language/translate/v2")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS("Translation stand-in stopped"))
@@ -0,0 +1,95 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0022_spotifydata_is_public"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SnapshotJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "wrapper_type",
+                    models.CharField(
+                        choices=[
+                            ("RECENTLY_PLAYED", "Recently Played"),
+                            ("TOP_TRACKS_SHORT", "Top Tracks Short Term"),
+                            ("TOP_TRACKS_MEDIUM", "Top Tracks Medium Term"),
+                            ("TOP_TRACKS_LONG", "Top Tracks Long Term"),
+                            ("TOP_ARTISTS", "Top Artists"),
+                            ("TOP_ALBUMS", "Top Albums"),
+                            ("TOP_GENRES", "Top Genres"),
+                            ("TOP_PLAYLISTS", "Top Playlists"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("RUNNING", "Running"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="QUEUED",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "spotify_data",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="users.spotifydata",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshot_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"], name="snapshotjob_status_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status__in", ["QUEUED", "RUNNING"])),
+                        fields=("user", "wrapper_type"),
+                        name="unique_in_flight_snapshot_job",
+                    )
+                ],
+            },
+        ),
+    ]
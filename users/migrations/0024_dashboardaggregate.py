@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0023_snapshotjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DashboardAggregate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("recent_tracks", models.JSONField(default=list)),
+                ("top_tracks", models.JSONField(default=dict)),
+                ("top_artists", models.JSONField(default=dict)),
+                ("genre_counts", models.JSONField(default=list)),
+                ("genre_total", models.IntegerField(default=0)),
+                ("top_album", models.JSONField(blank=True, null=True)),
+                ("ranked_playlists", models.JSONField(default=list)),
+                ("computed_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dashboard_aggregate",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0024_dashboardaggregate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="spotifydata",
+            index=models.Index(
+                condition=models.Q(("is_public", True)),
+                fields=["-created_at", "-id"],
+                name="spotifydata_public_feed_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0025_spotifydata_public_feed_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spotifydata",
+            name="payload",
+            field=models.JSONField(
+                blank=True,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="spotifydata",
+            name="payload_version",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
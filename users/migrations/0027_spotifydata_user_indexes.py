@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0026_spotifydata_payload"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="spotifydata",
+            index=models.Index(
+                fields=["user", "-created_at"], name="spotifydata_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="spotifydata",
+            index=models.Index(
+                fields=["user", "wrapper_type", "created_at"],
+                name="spotifydata_user_type_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0027_spotifydata_user_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Translation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source_hash", models.CharField(max_length=40)),
+                ("language", models.CharField(max_length=10)),
+                ("source", models.TextField()),
+                ("translated", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("source_hash", "language"), name="unique_translation"
+                    )
+                ],
+            },
+        ),
+    ]
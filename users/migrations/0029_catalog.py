@@ -0,0 +1,163 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0028_translation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogAlbum",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("spotify_id", models.CharField(max_length=255, unique=True)),
+                ("name", models.CharField(max_length=255)),
+                ("artist", models.CharField(max_length=255)),
+                ("image_url", models.URLField(blank=True, null=True)),
+                ("release_date", models.DateField(blank=True, null=True)),
+                ("total_tracks", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CatalogArtist",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("spotify_id", models.CharField(max_length=255, unique=True)),
+                ("name", models.CharField(max_length=255)),
+                ("image_url", models.URLField(blank=True, null=True)),
+                ("genres", models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CatalogTrack",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("spotify_id", models.CharField(max_length=255, unique=True)),
+                ("name", models.CharField(max_length=255)),
+                ("artist", models.CharField(max_length=255)),
+                ("album", models.CharField(max_length=255)),
+                ("image_url", models.URLField(blank=True, null=True)),
+            ],
+        ),
+        # The copies move to the catalog in 0030 and are dropped in 0031;
+        # nullable meanwhile so that both can be reversed
+        migrations.AlterField(
+            model_name="album",
+            name="album_id",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="album",
+            name="artist",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="album",
+            name="name",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="artist",
+            name="artist_id",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="artist",
+            name="name",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="album",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="artist",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="name",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="track_id",
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="album",
+            name="catalog",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogalbum",
+            ),
+        ),
+        migrations.AddField(
+            model_name="album",
+            name="rank",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="artist",
+            name="catalog",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogartist",
+            ),
+        ),
+        migrations.AddField(
+            model_name="artist",
+            name="rank",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="track",
+            name="catalog",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogtrack",
+            ),
+        ),
+        migrations.AddField(
+            model_name="track",
+            name="rank",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
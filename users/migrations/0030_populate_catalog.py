@@ -0,0 +1,85 @@
+import hashlib
+from collections import Counter
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+# snapshot model, catalog model, old id column, columns moved to the catalog
+MOVES = [
+    ("Track", "CatalogTrack", "track_id", ["name", "artist", "album", "image_url"]),
+    ("Artist", "CatalogArtist", "artist_id", ["name", "image_url", "genres"]),
+    ("Album", "CatalogAlbum", "album_id", ["name", "artist", "image_url", "release_date", "total_tracks"]),
+]
+
+
+def catalog_id(spotify_id, *identity):
+    # Same as users.models.catalog_id, copied so the migration doesn't depend on current code
+    if spotify_id:
+        return spotify_id
+    return "local:" + hashlib.sha1("|".join(str(part) for part in identity).encode()).hexdigest()
+
+
+def populate_catalog(apps, schema_editor):
+    """Move the copied strings of every snapshot row into the shared catalog and link the rows to it."""
+    for model_name, catalog_name, id_column, columns in MOVES:
+        model = apps.get_model("users", model_name)
+        catalog_model = apps.get_model("users", catalog_name)
+
+        ranks = Counter()
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by("id")[:BATCH_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            keys = {}
+            entries = {}
+            for row in rows:
+                key = catalog_id(getattr(row, id_column), row.name, getattr(row, "artist", ""))
+                keys[row.id] = key
+                entries.setdefault(key, catalog_model(
+                    spotify_id=key, **{column: getattr(row, column) for column in columns}
+                ))
+            catalog_model.objects.bulk_create(entries.values(), ignore_conflicts=True)
+            ids = dict(catalog_model.objects.filter(spotify_id__in=list(entries)).values_list("spotify_id", "id"))
+
+            for row in rows:
+                # Rows were inserted in the order they were ranked
+                ranks[row.spotify_data_id] += 1
+                row.rank = ranks[row.spotify_data_id]
+                row.catalog_id = ids[keys[row.id]]
+            model.objects.bulk_update(rows, ["catalog", "rank"])
+
+
+def restore_copies(apps, schema_editor):
+    """Copy the catalog columns back onto the snapshot rows, for reversing to before the catalog."""
+    for model_name, catalog_name, id_column, columns in MOVES:
+        model = apps.get_model("users", model_name)
+
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).select_related("catalog").order_by("id")[:BATCH_SIZE])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                spotify_id = row.catalog.spotify_id
+                # Local files had no Spotify ID, their catalog key is made up
+                setattr(row, id_column, "" if spotify_id.startswith("local:") else spotify_id)
+                for column in columns:
+                    setattr(row, column, getattr(row.catalog, column))
+            model.objects.bulk_update(rows, [id_column, *columns])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0029_catalog"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_catalog, restore_copies),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0030_populate_catalog"),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name="album", name="album_id"),
+        migrations.RemoveField(model_name="album", name="artist"),
+        migrations.RemoveField(model_name="album", name="image_url"),
+        migrations.RemoveField(model_name="album", name="name"),
+        migrations.RemoveField(model_name="album", name="release_date"),
+        migrations.RemoveField(model_name="album", name="total_tracks"),
+        migrations.RemoveField(model_name="artist", name="artist_id"),
+        migrations.RemoveField(model_name="artist", name="genres"),
+        migrations.RemoveField(model_name="artist", name="image_url"),
+        migrations.RemoveField(model_name="artist", name="name"),
+        migrations.RemoveField(model_name="track", name="album"),
+        migrations.RemoveField(model_name="track", name="artist"),
+        migrations.RemoveField(model_name="track", name="image_url"),
+        migrations.RemoveField(model_name="track", name="name"),
+        migrations.RemoveField(model_name="track", name="track_id"),
+        migrations.AlterField(
+            model_name="album",
+            name="catalog",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogalbum",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="artist",
+            name="catalog",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogartist",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="track",
+            name="catalog",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="appearances",
+                to="users.catalogtrack",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0031_remove_snapshot_catalog_copies"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spotifydata",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="spotifydata",
+            name="source",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.RESTRICT,
+                related_name="repeats",
+                to="users.spotifydata",
+            ),
+        ),
+    ]
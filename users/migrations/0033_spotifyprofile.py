@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0032_spotifydata_content_hash_source"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpotifyProfile",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="spotify_profile",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("top_tracks_short", models.JSONField(blank=True, null=True)),
+                ("top_tracks_medium", models.JSONField(blank=True, null=True)),
+                ("top_tracks_long", models.JSONField(blank=True, null=True)),
+            ],
+        ),
+    ]
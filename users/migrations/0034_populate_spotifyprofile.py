@@ -0,0 +1,57 @@
+from django.db import migrations
+from django.db.models import Q
+
+BATCH_SIZE = 500
+
+FIELDS = ["short", "medium", "long"]
+
+
+def copy_top_tracks(apps, schema_editor):
+    """Move the top-track lists of users that have any into their SpotifyProfile."""
+    User = apps.get_model("users", "User")
+    SpotifyProfile = apps.get_model("users", "SpotifyProfile")
+
+    columns = [f"spotify_top_tracks_{field}" for field in FIELDS]
+    users = User.objects.filter(
+        Q(spotify_top_tracks_short__isnull=False)
+        | Q(spotify_top_tracks_medium__isnull=False)
+        | Q(spotify_top_tracks_long__isnull=False)
+    ).order_by("id")
+
+    last_id = 0
+    while True:
+        rows = list(users.filter(id__gt=last_id).values_list("id", *columns)[:BATCH_SIZE])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        SpotifyProfile.objects.bulk_create(
+            [
+                SpotifyProfile(
+                    user_id=user_id,
+                    **{f"top_tracks_{field}": value for field, value in zip(FIELDS, values)}
+                )
+                for user_id, *values in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def restore_top_tracks(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    SpotifyProfile = apps.get_model("users", "SpotifyProfile")
+
+    for profile in SpotifyProfile.objects.iterator():
+        User.objects.filter(id=profile.user_id).update(
+            **{f"spotify_top_tracks_{field}": getattr(profile, f"top_tracks_{field}") for field in FIELDS}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0033_spotifyprofile"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_top_tracks, restore_top_tracks),
+    ]
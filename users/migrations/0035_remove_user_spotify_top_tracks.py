@@ -0,0 +1,16 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0034_populate_spotifyprofile"),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name="user", name="spotify_top_tracks_long"),
+        migrations.RemoveField(model_name="user", name="spotify_top_tracks_medium"),
+        migrations.RemoveField(model_name="user", name="spotify_top_tracks_short"),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0036_user_deletion_requested_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalogalbum",
+            name="last_seen_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="catalogartist",
+            name="last_seen_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="catalogtrack",
+            name="last_seen_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
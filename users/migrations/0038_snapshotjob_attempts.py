@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0037_catalog_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshotjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,25 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
 from django.utils import timezone
-from django.db import IntegrityError
+from django.utils.dateparse import parse_date
+from django.utils.translation import gettext_lazy as _
+from django.db import IntegrityError, OperationalError
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+import hashlib
+import json
 import logging
-import requests
+import threading
+import time
+from . import tokens
+from .fanout import FanOut
+from .spotify_wrapper import (
+    capture_limit, collect_items, compact_artist, compact_playlist, compact_recent,
+    compact_track, get_playlist_totals, iter_items, search_album
+)
 
 # Setting up a logger
 logger = logging.getLogger(__name__)
@@ -14,10 +30,10 @@ class User(AbstractUser):
     spotify_access_token = models.CharField(max_length=255, null=True, blank=True)
     spotify_refresh_token = models.CharField(max_length=255, null=True, blank=True)
     spotify_token_expires = models.DateTimeField(null=True, blank=True)
-    spotify_top_tracks_short = models.JSONField(null=True, blank=True)
-    spotify_top_tracks_medium = models.JSONField(null=True, blank=True)
-    spotify_top_tracks_long = models.JSONField(null=True, blank=True)
     spotify_last_updated = models.DateTimeField(null=True, blank=True)
+    # Set when the account is handed to a background deletion, which
+    # `manage.py finish_account_deletions` completes if it was interrupted
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     REQUIRED_FIELDS = ['email']
 
@@ -132,36 +148,44 @@ class User(AbstractUser):
             self.spotify_access_token = None
             self.spotify_refresh_token = None
             self.spotify_token_expires = None
-            self.spotify_top_tracks_short = None
-            self.spotify_top_tracks_medium = None
-            self.spotify_top_tracks_long = None
             self.spotify_last_updated = None
             self.save(update_fields=[
                 'spotify_id',
                 'spotify_access_token',
                 'spotify_refresh_token',
                 'spotify_token_expires',
-                'spotify_top_tracks_short',
-                'spotify_top_tracks_medium',
-                'spotify_top_tracks_long',
                 'spotify_last_updated'
             ])
+            SpotifyProfile.objects.filter(user=self).delete()
+            tokens.forget(self.id)
             return True
         except Exception as e:
             logger.error(f"Error clearing Spotify data: {str(e)}")
             return False
 
+class SpotifyProfile(models.Model):
+    """
+    A user's top-track lists, kept off the User row so the query behind
+    every authenticated request stays narrow. Load it only where it's used.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='spotify_profile')
+    top_tracks_short = models.JSONField(null=True, blank=True)
+    top_tracks_medium = models.JSONField(null=True, blank=True)
+    top_tracks_long = models.JSONField(null=True, blank=True)
+
+
 class SpotifyData(models.Model):
     """Base model for storing Spotify data snapshots"""
+    # Labels resolve through the gettext catalogs in locale/
     WRAPPER_TYPES = [
-        ('RECENTLY_PLAYED', 'Recently Played'),
-        ('TOP_TRACKS_SHORT', 'Top Tracks Short Term'),
-        ('TOP_TRACKS_MEDIUM', 'Top Tracks Medium Term'),
-        ('TOP_TRACKS_LONG', 'Top Tracks Long Term'),
-        ('TOP_ARTISTS', 'Top Artists'),
-        ('TOP_ALBUMS', 'Top Albums'),
-        ('TOP_GENRES', 'Top Genres'),
-        ('TOP_PLAYLISTS', 'Top Playlists'),
+        ('RECENTLY_PLAYED', _('Recently Played')),
+        ('TOP_TRACKS_SHORT', _('Top Tracks Short Term')),
+        ('TOP_TRACKS_MEDIUM', _('Top Tracks Medium Term')),
+        ('TOP_TRACKS_LONG', _('Top Tracks Long Term')),
+        ('TOP_ARTISTS', _('Top Artists')),
+        ('TOP_ALBUMS', _('Top Albums')),
+        ('TOP_GENRES', _('Top Genres')),
+        ('TOP_PLAYLISTS', _('Top Playlists')),
     ]
 
     WRAPPER_TYPE_MAP = {
@@ -175,53 +199,271 @@ class SpotifyData(models.Model):
         'Top Playlists': 'TOP_PLAYLISTS'
     }
 
+    # The one child relation each wrapper type stores its items in
+    RELATIONS = {
+        'RECENTLY_PLAYED': 'tracks',
+        'TOP_TRACKS_SHORT': 'tracks',
+        'TOP_TRACKS_MEDIUM': 'tracks',
+        'TOP_TRACKS_LONG': 'tracks',
+        'TOP_ARTISTS': 'artists',
+        'TOP_ALBUMS': 'albums',
+        'TOP_GENRES': 'genres',
+        'TOP_PLAYLISTS': 'playlists',
+    }
+
+    # Child columns the wraps pages render, per relation
+    RENDERED_FIELDS = {
+        'tracks': ['name', 'artist', 'album', 'popularity'],
+        'artists': ['name', 'genres', 'popularity'],
+        'albums': ['name', 'artist', 'release_date', 'total_tracks'],
+        'genres': ['name', 'count', 'percentage'],
+        'playlists': ['name', 'description', 'total_duration_minutes', 'track_count'],
+    }
+
+    # Bump when RENDERED_FIELDS changes; older payloads are ignored until backfilled
+    PAYLOAD_VERSION = 1
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spotify_data')
     wrapper_type = models.CharField(max_length=20, choices=WRAPPER_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
     is_public = models.BooleanField(default=False)
+    # Rendered fields of the children, denormalized at capture time so a wrap
+    # can be shown without touching the child tables
+    payload = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    payload_version = models.PositiveSmallIntegerField(default=0)
+    # Digest of the payload, to spot a capture identical to the previous one
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    # Set on a capture identical to an earlier one: it stores no children or
+    # payload of its own and is rendered from the snapshot it points at
+    source = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.RESTRICT, related_name='repeats'
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the public feed on (created_at, id)
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='spotifydata_public_feed_idx',
+                condition=models.Q(is_public=True)
+            ),
+            # A user's wraps, newest first (wraps_view)
+            models.Index(fields=['user', '-created_at'], name='spotifydata_user_created_idx'),
+            # Looking up one wrap to delete or publish
+            models.Index(fields=['user', 'wrapper_type', 'created_at'], name='spotifydata_user_type_idx'),
+        ]
 
     @classmethod
     def get_internal_wrapper_type(cls, human_readable_type):
-        """Maps human-readable wrapper type to internal code."""
+        """Maps human-readable (English) wrapper type to internal code; codes pass through."""
+        if human_readable_type in cls.RELATIONS:
+            return human_readable_type
         return cls.WRAPPER_TYPE_MAP.get(human_readable_type)
 
+    @property
+    def relation(self):
+        return self.RELATIONS.get(self.wrapper_type)
 
-class Track(models.Model):
-    """Model for storing track information"""
-    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='tracks')
-    track_id = models.CharField(max_length=255)
+    @classmethod
+    def payload_item(cls, relation, obj):
+        """The rendered fields of one child row."""
+        return {field: getattr(obj, field) for field in cls.RENDERED_FIELDS[relation]}
+
+    def build_payload(self):
+        """Payload built from the child rows, for snapshots saved before it existed."""
+        if not self.relation:
+            return []
+        return [self.payload_item(self.relation, obj) for obj in getattr(self, self.relation).all()]
+
+    def has_payload(self):
+        return self.payload is not None and self.payload_version == self.PAYLOAD_VERSION
+
+    def payload_items(self):
+        """The payload decoded back into what the templates expect."""
+        items = []
+        for item in self.payload:
+            if isinstance(item.get('release_date'), str):
+                item = {**item, 'release_date': parse_date(item['release_date'])}
+            items.append(item)
+        return items
+
+    @staticmethod
+    def content_digest(payload):
+        """Identifies a capture by what it renders, whatever order its rows were written in."""
+        return hashlib.sha256(
+            json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        ).hexdigest()
+
+    def hand_over_repeats(self, exclude=()):
+        """
+        Before deleting a snapshot other captures point at, move its children
+        and payload to the oldest of them and repoint the rest there.
+        Repeats in ``exclude`` (being deleted alongside) can't inherit.
+        """
+        repeats = list(self.repeats.exclude(id__in=exclude).order_by('created_at', 'id').only('id'))
+        if not repeats:
+            return
+        heir = repeats[0]
+        if self.relation:
+            getattr(self, self.relation).update(spotify_data=heir)
+        SpotifyData.objects.filter(id=heir.id).update(
+            source=None, payload=self.payload, payload_version=self.payload_version
+        )
+        self.repeats.exclude(id=heir.id).update(source=heir)
+
+
+def prefetch_wraps(data_entries):
+    """
+    Load the children of SpotifyData entries that have no current payload,
+    one query per relation actually present instead of one for each of the five.
+
+    Entries are grouped by the relation their wrapper_type uses and each group
+    gets a Prefetch limited to the columns in RENDERED_FIELDS, joining in the
+    catalog row for relations whose details live there. Each entry gets a
+    ``content`` attribute: the snapshot to render it from, itself unless
+    it's a repeat of an earlier capture.
+    """
+    data_entries = list(data_entries)
+
+    # Repeated captures are rendered from the snapshot they point at, which
+    # is usually on the same page already
+    by_id = {entry.id: entry for entry in data_entries}
+    missing = {entry.source_id for entry in data_entries if entry.source_id and entry.source_id not in by_id}
+    if missing:
+        by_id.update(
+            SpotifyData.objects.only('id', 'wrapper_type', 'payload', 'payload_version').in_bulk(missing)
+        )
+    for entry in data_entries:
+        entry.content = by_id.get(entry.source_id, entry)
+
+    groups = defaultdict(list)
+    for content in {entry.content.id: entry.content for entry in data_entries}.values():
+        if content.relation and not content.has_payload():
+            groups[content.relation].append(content)
+
+    for relation, entries in groups.items():
+        prefetch_related_objects(entries, Prefetch(relation, queryset=rendered_children(relation)))
+
+    return data_entries
+
+
+def rendered_children(relation):
+    """The children of one relation as prefetch_wraps loads them: rendered columns only, catalog joined in."""
+    model = SpotifyData._meta.get_field(relation).related_model
+    catalog_fields = getattr(model, 'CATALOG_FIELDS', [])
+    columns = [
+        f'catalog__{field}' if field in catalog_fields else field
+        for field in SpotifyData.RENDERED_FIELDS[relation]
+    ]
+    queryset = model.objects.order_by('id')
+    if catalog_fields:
+        queryset = queryset.select_related('catalog')
+        columns.append('catalog')
+    return queryset.only('spotify_data', *columns)
+
+
+def wrap_lookup(user, wrapper_type_code, created_at):
+    """The user's snapshot of a wrapper type taken at ``created_at``, which is how pages address a wrap."""
+    return SpotifyData.objects.filter(user=user, wrapper_type=wrapper_type_code, created_at=created_at)
+
+
+def catalog_id(spotify_id, *identity):
+    """
+    Catalog key for an item: its Spotify ID, or for items Spotify gives no
+    ID (local files) a stable one derived from ``identity``, e.g. name and artist.
+    """
+    if spotify_id:
+        return spotify_id
+    return 'local:' + hashlib.sha1('|'.join(str(part) for part in identity).encode()).hexdigest()
+
+
+def _from_catalog(field):
+    """Read-through to the shared catalog row, so snapshot rows keep their old attributes."""
+    return property(lambda self: getattr(self.catalog, field))
+
+
+class CatalogTrack(models.Model):
+    """One row per Spotify track, shared by every snapshot it appears in"""
+    spotify_id = models.CharField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     artist = models.CharField(max_length=255)
     album = models.CharField(max_length=255)
     image_url = models.URLField(null=True, blank=True)
-    played_at = models.DateTimeField(null=True, blank=True)  # For recently played tracks
-    popularity = models.IntegerField(default=0)
+    # Refreshed by every capture that upserts the row, see compact_wraps --prune-catalog
+    last_seen_at = models.DateTimeField(auto_now=True)
 
 
-class Artist(models.Model):
-    """Model for storing artist information"""
-    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='artists')
-    artist_id = models.CharField(max_length=255)
+class CatalogArtist(models.Model):
+    """One row per Spotify artist, shared by every snapshot it appears in"""
+    spotify_id = models.CharField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     image_url = models.URLField(null=True, blank=True)
     genres = models.JSONField(default=list)
-    popularity = models.IntegerField(default=0)
+    # Refreshed by every capture that upserts the row, see compact_wraps --prune-catalog
+    last_seen_at = models.DateTimeField(auto_now=True)
 
 
-class Album(models.Model):
-    """Model for storing album information"""
-    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='albums')
-    album_id = models.CharField(max_length=255)
+class CatalogAlbum(models.Model):
+    """One row per Spotify album, shared by every snapshot it appears in"""
+    spotify_id = models.CharField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     artist = models.CharField(max_length=255)
     image_url = models.URLField(null=True, blank=True)
     release_date = models.DateField(null=True, blank=True)
     total_tracks = models.IntegerField(default=0)
+    # Refreshed by every capture that upserts the row, see compact_wraps --prune-catalog
+    last_seen_at = models.DateTimeField(auto_now=True)
+
+
+class Track(models.Model):
+    """A track's place in one snapshot; the track itself is in CatalogTrack"""
+    CATALOG_FIELDS = ['name', 'artist', 'album', 'image_url']
+
+    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='tracks')
+    catalog = models.ForeignKey(CatalogTrack, on_delete=models.PROTECT, related_name='appearances')
+    rank = models.PositiveIntegerField(default=0)
+    played_at = models.DateTimeField(null=True, blank=True)  # For recently played tracks
+    popularity = models.IntegerField(default=0)
+
+    track_id = _from_catalog('spotify_id')
+    name = _from_catalog('name')
+    artist = _from_catalog('artist')
+    album = _from_catalog('album')
+    image_url = _from_catalog('image_url')
+
+
+class Artist(models.Model):
+    """An artist's place in one snapshot; the artist itself is in CatalogArtist"""
+    CATALOG_FIELDS = ['name', 'image_url', 'genres']
+
+    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='artists')
+    catalog = models.ForeignKey(CatalogArtist, on_delete=models.PROTECT, related_name='appearances')
+    rank = models.PositiveIntegerField(default=0)
+    popularity = models.IntegerField(default=0)
+
+    artist_id = _from_catalog('spotify_id')
+    name = _from_catalog('name')
+    image_url = _from_catalog('image_url')
+    genres = _from_catalog('genres')
+
+
+class Album(models.Model):
+    """An album's place in one snapshot; the album itself is in CatalogAlbum"""
+    CATALOG_FIELDS = ['name', 'artist', 'image_url', 'release_date', 'total_tracks']
+
+    spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='albums')
+    catalog = models.ForeignKey(CatalogAlbum, on_delete=models.PROTECT, related_name='appearances')
+    rank = models.PositiveIntegerField(default=0)
     play_count = models.IntegerField(default=1)  # For tracking most listened album
 
+    album_id = _from_catalog('spotify_id')
+    name = _from_catalog('name')
+    artist = _from_catalog('artist')
+    image_url = _from_catalog('image_url')
+    release_date = _from_catalog('release_date')
+    total_tracks = _from_catalog('total_tracks')
+
 class Genre(models.Model):
     spotify_data = models.ForeignKey(SpotifyData, on_delete=models.CASCADE, related_name='genres')
     name = models.CharField(max_length=100)
@@ -238,176 +480,588 @@ class Playlist(models.Model):
     track_count = models.PositiveIntegerField()
 
 
-# Helper function to save Spotify data
-def save_spotify_wrapper(user, access_token, wrapper_type):
+class Translation(models.Model):
+    """Persistent cache of machine translations, keyed by (source text hash, language)."""
+    source_hash = models.CharField(max_length=40)
+    language = models.CharField(max_length=10)
+    source = models.TextField()
+    translated = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source_hash', 'language'], name='unique_translation')
+        ]
+
+
+class IncompleteAggregateError(Exception):
     """
-    Save Spotify data based on wrapper type
+    Some of the Spotify calls behind a DashboardAggregate failed. ``aggregate``
+    holds the figures that could be computed, unsaved.
     """
-    headers = {'Authorization': f'Bearer {access_token}'}
-    base_url = 'https://api.spotify.com/v1/me'
 
-    spotify_data = SpotifyData.objects.create(
-        user=user,
-        wrapper_type=wrapper_type
-    )
+    def __init__(self, failed, aggregate):
+        super().__init__(f"Spotify calls failed: {', '.join(map(str, failed))}")
+        self.failed = failed
+        self.aggregate = aggregate
+
+
+# user id -> Future of the DashboardAggregate refresh this process is running for them
+_aggregate_refreshes = {}
+_aggregate_refreshes_lock = threading.Lock()
 
-    if wrapper_type == 'RECENTLY_PLAYED':
-        recent_tracks_response = requests.get(
-            f'{base_url}/player/recently-played',
-            headers=headers,
-            params={'limit': 10}
+
+class DashboardAggregate(models.Model):
+    """
+    Per-user dashboard figures in compact form, computed once per refresh
+    and read by both the dashboard and snapshot capture
+    """
+    TIME_RANGES = ['short_term', 'medium_term', 'long_term']
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='dashboard_aggregate')
+    recent_tracks = models.JSONField(default=list)
+    top_tracks = models.JSONField(default=dict)  # time range -> compact tracks
+    top_artists = models.JSONField(default=dict)  # time range -> compact artists
+    genre_counts = models.JSONField(default=list)  # [genre, count] pairs, most common first
+    genre_total = models.IntegerField(default=0)  # occurrences across all genres, for percentages
+    top_album = models.JSONField(null=True, blank=True)
+    ranked_playlists = models.JSONField(default=list)  # longest first
+    computed_at = models.DateTimeField()
+
+    def is_fresh(self):
+        max_age = getattr(settings, 'DASHBOARD_AGGREGATE_TTL', 60 * 5)
+        return timezone.now() - self.computed_at < timezone.timedelta(seconds=max_age)
+
+    @classmethod
+    def get_fresh(cls, user, access_token):
+        """The user's aggregate, recomputed first if it is missing or stale."""
+        aggregate = cls.objects.filter(user=user).first()
+        if aggregate and aggregate.is_fresh():
+            return aggregate
+        return cls.refresh(user, access_token)
+
+    @classmethod
+    def refresh(cls, user, access_token):
+        """
+        Fetch the user's data from Spotify, recompute every figure and store it.
+
+        Concurrent refreshes for the same user in this process share one
+        fetch. If any Spotify call fails nothing is stored and
+        IncompleteAggregateError is raised, so partial figures are never
+        served from the table or saved as a complete wrap.
+        """
+        with _aggregate_refreshes_lock:
+            future = _aggregate_refreshes.get(user.id)
+            leader = future is None
+            if leader:
+                future = _aggregate_refreshes[user.id] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            aggregate = cls._fetch(user, access_token)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(aggregate)
+            return aggregate
+        finally:
+            with _aggregate_refreshes_lock:
+                del _aggregate_refreshes[user.id]
+
+    @classmethod
+    def _fetch(cls, user, access_token):
+        headers = {'Authorization': f'Bearer {access_token}'}
+        base_url = 'https://api.spotify.com/v1'
+
+        # First wave: every call that only needs the access token runs concurrently
+        fanout = FanOut(user.id)
+        fanout.submit(
+            'recent_tracks', collect_items,
+            f'{base_url}/me/player/recently-played', headers,
+            user_key=user.id, max_items=capture_limit('recently_played'), default=[]
+        )
+        fanout.submit(
+            'playlists', collect_items,
+            f'{base_url}/me/playlists', headers,
+            user_key=user.id, max_items=capture_limit('playlists'), default=[]
         )
-        recent_tracks = recent_tracks_response.json().get('items', [])
-
-        for track in recent_tracks:
-            Track.objects.create(
-                spotify_data=spotify_data,
-                track_id=track['track']['id'],
-                name=track['track']['name'],
-                artist=track['track']['artists'][0]['name'],
-                album=track['track']['album']['name'],
-                image_url=track['track']['album']['images'][0]['url'] if track['track']['album']['images'] else None,
-                played_at=track['played_at'],
-                popularity=track['track']['popularity']
+        # The dashboard shows (and computes its genre and album figures from)
+        # the top 10, whatever snapshot captures are configured to page through
+        top_items = getattr(settings, 'DASHBOARD_TOP_ITEMS', 10)
+        for time_range in cls.TIME_RANGES:
+            params = {'time_range': time_range}
+            fanout.submit(
+                ('tracks', time_range), collect_items,
+                f'{base_url}/me/top/tracks', headers, params,
+                user_key=user.id, max_items=top_items, default=[]
             )
-
-    elif wrapper_type.startswith('TOP_TRACKS'):
-        time_range = {
-            'TOP_TRACKS_SHORT': 'short_term',
-            'TOP_TRACKS_MEDIUM': 'medium_term',
-            'TOP_TRACKS_LONG': 'long_term'
-        }[wrapper_type]
-
-        top_tracks_response = requests.get(
-            f'{base_url}/top/tracks',
-            headers=headers,
-            params={'limit': 10, 'time_range': time_range}
+            fanout.submit(
+                ('artists', time_range), collect_items,
+                f'{base_url}/me/top/artists', headers, params,
+                user_key=user.id, max_items=top_items, default=[]
+            )
+        results = fanout.results()
+
+        top_tracks, top_artists = {}, {}
+        genre_counts, album_counts = Counter(), Counter()
+        for time_range in cls.TIME_RANGES:
+            top_tracks[time_range] = [compact_track(track) for track in results[('tracks', time_range)]]
+            top_artists[time_range] = [compact_artist(artist) for artist in results[('artists', time_range)]]
+            album_counts.update(track['album'] for track in top_tracks[time_range])
+            for artist in top_artists[time_range]:
+                genre_counts.update(artist['genres'])
+        most_listened_album = album_counts.most_common(1)
+        recent_tracks = [compact_recent(item) for item in results['recent_tracks']]
+        playlists = results['playlists']
+
+        # Second wave: calls that depend on the first one, again run concurrently
+        for playlist in playlists:
+            fanout.submit(
+                ('totals', playlist['id']), get_playlist_totals,
+                playlist['id'], headers, user.id, default=(0, 0)
+            )
+        if most_listened_album:
+            fanout.submit('album', search_album, most_listened_album[0][0], headers, user.id)
+        results = fanout.results()
+
+        ranked_playlists = sorted(
+            (compact_playlist(playlist, *results[('totals', playlist['id'])]) for playlist in playlists),
+            key=lambda playlist: playlist['duration'],
+            reverse=True
         )
-        top_tracks = top_tracks_response.json().get('items', [])
-
-        for track in top_tracks:
-            Track.objects.create(
-                spotify_data=spotify_data,
-                track_id=track['id'],
-                name=track['name'],
-                artist=track['artists'][0]['name'],
-                album=track['album']['name'],
-                image_url=track['album']['images'][0]['url'] if track['album']['images'] else None,
-                popularity=track['popularity']
+        top_album = results.get('album')
+        if top_album:
+            top_album['play_count'] = most_listened_album[0][1]
+
+        figures = {
+            'recent_tracks': recent_tracks,
+            'top_tracks': top_tracks,
+            'top_artists': top_artists,
+            'genre_counts': genre_counts.most_common(50),
+            'genre_total': sum(genre_counts.values()),
+            'top_album': top_album,
+            'ranked_playlists': ranked_playlists,
+            'computed_at': timezone.now(),
+        }
+        if fanout.failed:
+            raise IncompleteAggregateError(fanout.failed, cls(user=user, **figures))
+
+        aggregate, _ = cls.objects.update_or_create(user=user, defaults=figures)
+        return aggregate
+
+
+class SnapshotJob(models.Model):
+    """A queued snapshot capture, run in the background by the snapshot_worker command"""
+    STATUSES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    IN_FLIGHT = ['QUEUED', 'RUNNING']
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='snapshot_jobs')
+    wrapper_type = models.CharField(max_length=20, choices=SpotifyData.WRAPPER_TYPES)
+    status = models.CharField(max_length=10, choices=STATUSES, default='QUEUED')
+    spotify_data = models.ForeignKey(
+        SpotifyData, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # times the job has been claimed
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='snapshotjob_status_idx'),
+        ]
+        constraints = [
+            # At most one queued or running capture per (user, wrapper_type)
+            models.UniqueConstraint(
+                fields=['user', 'wrapper_type'],
+                name='unique_in_flight_snapshot_job',
+                condition=models.Q(status__in=['QUEUED', 'RUNNING'])
             )
+        ]
 
-    elif wrapper_type == 'TOP_ARTISTS':
-        top_artists_response = requests.get(
-            f'{base_url}/top/artists',
-            headers=headers,
-            params={'limit': 10, 'time_range': 'short_term'}
+    @classmethod
+    def enqueue(cls, user, wrapper_type):
+        """
+        Queue a capture for the user, or return the identical capture that is
+        already queued or running.
+        """
+        in_flight = cls.objects.filter(user=user, wrapper_type=wrapper_type, status__in=cls.IN_FLIGHT)
+        while True:
+            job = in_flight.first()
+            if job:
+                return job
+
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(user=user, wrapper_type=wrapper_type)
+            except IntegrityError:
+                # An identical request got in between: hand back that one, or
+                # queue again if it has already finished
+                continue
+
+    @classmethod
+    def queued(cls):
+        """Jobs waiting for a worker, oldest first."""
+        return cls.objects.filter(status='QUEUED').order_by('created_at')
+
+    def claim(self):
+        """
+        Atomically move the job from QUEUED to RUNNING.
+        Returns False if another worker claimed it first.
+        """
+        now = timezone.now()
+        claimed = SnapshotJob.objects.filter(id=self.id, status='QUEUED').update(
+            status='RUNNING',
+            started_at=now,
+            attempts=F('attempts') + 1
         )
-        top_artists = top_artists_response.json().get('items', [])
-
-        for artist in top_artists:
-            Artist.objects.create(
-                spotify_data=spotify_data,
-                artist_id=artist['id'],
-                name=artist['name'],
-                image_url=artist['images'][0]['url'] if artist['images'] else None,
-                genres=artist['genres'],
-                popularity=artist['popularity']
-                )
+        if claimed:
+            self.status = 'RUNNING'
+            self.started_at = now
+            self.attempts += 1
+        return bool(claimed)
+
+    def run(self):
+        """
+        Capture the snapshot and record the outcome on the job. A database
+        error (typically "database is locked" while other jobs write) puts the
+        job back in the queue, until it has run SNAPSHOT_JOB_MAX_ATTEMPTS times.
+        """
+        try:
+            access_token = tokens.get_access_token(self.user)
+            if not access_token:
+                raise ValueError("No valid Spotify token found")
+
+            self.spotify_data = save_spotify_wrapper(self.user, access_token, self.wrapper_type)
+            self.status = 'DONE'
+        except OperationalError as e:
+            if self.attempts < getattr(settings, 'SNAPSHOT_JOB_MAX_ATTEMPTS', 3):
+                logger.warning(f"Snapshot job {self.id} hit a database error, requeueing: {str(e)}")
+                self.status = 'QUEUED'
+                self.started_at = None
+                self.error = str(e)
+                self.save(update_fields=['status', 'started_at', 'error'])
+                return
+            logger.error(f"Snapshot job {self.id} failed after {self.attempts} attempts: {str(e)}")
+            self.status = 'FAILED'
+            self.error = str(e)
+        except Exception as e:
+            logger.error(f"Snapshot job {self.id} failed: {str(e)}")
+            self.status = 'FAILED'
+            self.error = str(e)
+
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'spotify_data', 'error', 'finished_at'])
 
-    elif wrapper_type == 'TOP_ALBUMS':
-        all_tracks = []
-        for time_range in ['short_term', 'medium_term', 'long_term']:
-            top_tracks_response = requests.get(
-                f'{base_url}/top/tracks',
-                headers=headers,
-                params={'limit': 10, 'time_range': time_range}
-            )
-            tracks = top_tracks_response.json().get('items', [])
-            all_tracks.extend(tracks)
 
-        from collections import Counter
-        album_counts = Counter(track['album']['name'] for track in all_tracks)
-        most_listened = album_counts.most_common(1)[0]
+class SnapshotWriter:
+    """
+    Writes the child rows of one SpotifyData snapshot with one bulk INSERT
+    per SNAPSHOT_BATCH_SIZE rows, all inside a single transaction, so a
+    snapshot is either saved whole or not at all.
+
+    Used as a context manager: rows are buffered while pages are streamed in
+    and only written when the block exits, so the transaction is never held
+    open across a Spotify request. An exception inside the block discards
+    the buffer without touching the database. The rendered fields of every
+    row are collected as they're added and stored as the snapshot's payload.
+
+    Tracks, artists and albums are added with an unsaved catalog row
+    (``catalog=CatalogTrack(...)``); each batch upserts its catalog rows by
+    Spotify ID first, so the snapshot itself only stores references and ranks.
+
+    A capture whose payload matches the user's latest snapshot of the same
+    type is saved as a repeat: a row of its own (so it's listed as a
+    separate capture) pointing at the snapshot that holds the children.
+    """
 
-        album_search_response = requests.get(
-            'https://api.spotify.com/v1/search',
-            headers=headers,
-            params={'q': f'album:{most_listened[0]}', 'type': 'album', 'limit': 1}
+    def __init__(self, user, wrapper_type):
+        self.user = user
+        self.wrapper_type = wrapper_type
+        self.batch_size = getattr(settings, 'SNAPSHOT_BATCH_SIZE', 500)
+        self.buffers = defaultdict(list)
+        self.counts = Counter()
+        self.ranks = Counter()
+        self.spotify_data = None
+        self.payload = []
+        self.stats = {}
+        self._started = time.perf_counter()
+        self._write_seconds = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.save()
+        return False
+
+    def add(self, model, **fields):
+        row = model(**fields)
+        if hasattr(model, 'CATALOG_FIELDS'):
+            self.ranks[model] += 1
+            row.rank = self.ranks[model]
+        self.payload.append(SpotifyData.payload_item(SpotifyData.RELATIONS[self.wrapper_type], row))
+        self.buffers[model].append(row)
+
+    def _flush(self, model):
+        rows = self.buffers.pop(model, [])
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            if hasattr(model, 'CATALOG_FIELDS'):
+                self._upsert_catalog(model, batch)
+            for row in batch:
+                row.spotify_data = self.spotify_data
+            model.objects.bulk_create(batch)
+        self.counts[model.__name__] += len(rows)
+
+    def _upsert_catalog(self, model, rows):
+        """Insert or refresh the catalog rows a batch points at, then point the batch at their ids."""
+        catalog_model = model._meta.get_field('catalog').related_model
+        # One row per Spotify ID, the same track can be in a batch several times
+        entries = {row.catalog.spotify_id: row.catalog for row in rows}
+        catalog_model.objects.bulk_create(
+            entries.values(),
+            update_conflicts=True,
+            unique_fields=['spotify_id'],
+            update_fields=[*model.CATALOG_FIELDS, 'last_seen_at'],
         )
-        album_search = album_search_response.json()
-
-        if album_search['albums']['items']:
-            album_info = album_search['albums']['items'][0]
-            Album.objects.create(
-                spotify_data=spotify_data,
-                album_id=album_info['id'],
-                name=album_info['name'],
-                artist=album_info['artists'][0]['name'],
-                image_url=album_info['images'][0]['url'] if album_info['images'] else None,
-                release_date=album_info.get('release_date'),
-                total_tracks=album_info.get('total_tracks', 0),
-                play_count=most_listened[1]
+        ids = dict(catalog_model.objects.filter(spotify_id__in=list(entries)).values_list('spotify_id', 'id'))
+        for row in rows:
+            row.catalog.id = ids[row.catalog.spotify_id]
+            row.catalog_id = row.catalog.id
+
+    def _unchanged_source(self, content_hash):
+        """The snapshot holding this capture's content if the latest one of its type has the same."""
+        if not getattr(settings, 'SNAPSHOT_DEDUPE', True):
+            return None
+        latest = SpotifyData.objects.filter(
+            user=self.user, wrapper_type=self.wrapper_type
+        ).order_by('-created_at', '-id').only('id', 'source', 'content_hash').first()
+        if latest is None or latest.content_hash != content_hash:
+            return None
+        return latest.source_id or latest.id
+
+    def save(self):
+        """Write the snapshot and everything buffered in one transaction; returns the SpotifyData row."""
+        write_started = time.perf_counter()
+        content_hash = SpotifyData.content_digest(self.payload)
+        with transaction.atomic():
+            source_id = self._unchanged_source(content_hash)
+            self.spotify_data = SpotifyData(
+                user=self.user,
+                wrapper_type=self.wrapper_type,
+                content_hash=content_hash,
+                source_id=source_id
             )
-    elif wrapper_type == 'TOP_GENRES':
-        # Get top artists from all time ranges to get a comprehensive view
-        all_genres = []
-        for time_range in ['short_term', 'medium_term', 'long_term']:
-            top_artists_response = requests.get(
-                f'{base_url}/top/artists',
+            if source_id:
+                # Nothing changed: keep only the pointer
+                self.buffers.clear()
+            else:
+                self.spotify_data.payload = self.payload
+                self.spotify_data.payload_version = SpotifyData.PAYLOAD_VERSION
+            self.spotify_data.save()
+
+            for model in list(self.buffers):
+                self._flush(model)
+        self._write_seconds = time.perf_counter() - write_started
+
+        self.stats = {
+            'rows': dict(self.counts),
+            'repeat_of': self.spotify_data.source_id,
+            'elapsed_ms': round((time.perf_counter() - self._started) * 1000, 2),
+            'write_ms': round(self._write_seconds * 1000, 2),
+        }
+        logger.info(f"Saved {self.wrapper_type} snapshot {self.spotify_data.id} for user {self.user.id}: {self.stats}")
+        self.spotify_data.snapshot_stats = self.stats
+        return self.spotify_data
+
+
+# Helper function to save Spotify data
+def save_spotify_wrapper(user, access_token, wrapper_type):
+    """
+    Save Spotify data based on wrapper type.
+    Spotify pages are streamed into a SnapshotWriter, which writes them in
+    one short transaction at the end, so a failed upstream call (iter_items
+    raises on a bad page) never leaves a partial snapshot behind.
+    """
+    headers = {'Authorization': f'Bearer {access_token}'}
+    base_url = 'https://api.spotify.com/v1/me'
+
+    with SnapshotWriter(user, wrapper_type) as writer:
+        if wrapper_type == 'RECENTLY_PLAYED':
+            for track in iter_items(
+                f'{base_url}/player/recently-played',
                 headers=headers,
-                params={'limit': 10, 'time_range': time_range}
-            )
-            artists = top_artists_response.json().get('items', [])
-            for artist in artists:
-                all_genres.extend(artist['genres'])
-
-        # Count genre occurrences and get top 10
-        from collections import Counter
-        genre_counts = Counter(all_genres)
-        top_genres = genre_counts.most_common(10)
-
-        # Save each top genre
-        for genre, count in top_genres:
-            Genre.objects.create(
-                spotify_data=spotify_data,
-                name=genre,
-                count=count,
-                # Calculate percentage based on total genre occurrences
-                percentage=round((count / len(all_genres)) * 100, 2)
-            )
-    elif wrapper_type == 'TOP_PLAYLISTS':
-        top_playlists_response = requests.get(
-            f'{base_url}/playlists',
-            headers=headers,
-            params={'limit': 10}
-        )
-        top_playlists = top_playlists_response.json().get('items', [])
+                user_key=user.id,
+                max_items=capture_limit('recently_played')
+            ):
+                writer.add(
+                    Track,
+                    catalog=CatalogTrack(
+                        spotify_id=catalog_id(
+                            track['track']['id'], track['track']['name'], track['track']['artists'][0]['name']
+                        ),
+                        name=track['track']['name'],
+                        artist=track['track']['artists'][0]['name'],
+                        album=track['track']['album']['name'],
+                        image_url=track['track']['album']['images'][0]['url'] if track['track']['album']['images'] else None
+                    ),
+                    played_at=track['played_at'],
+                    popularity=track['track']['popularity']
+                )
 
-        for playlist in top_playlists:
-            playlist_id = playlist['id']
-            playlist_duration_response = requests.get(
-                f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks',
+        elif wrapper_type.startswith('TOP_TRACKS'):
+            time_range = {
+                'TOP_TRACKS_SHORT': 'short_term',
+                'TOP_TRACKS_MEDIUM': 'medium_term',
+                'TOP_TRACKS_LONG': 'long_term'
+            }[wrapper_type]
+
+            for track in iter_items(
+                f'{base_url}/top/tracks',
                 headers=headers,
-            )
-            tracks = playlist_duration_response.json().get('items', [])
-
-            track_durations = []
-            for item in tracks:
-                track_durations.append(item['track']['duration_ms'])  # Duration in milliseconds
-
-            total_duration_minutes = sum(track_durations) / 1000 / 60  # Convert from ms to minutes
-
-            Playlist.objects.create(
-                spotify_data=spotify_data,
-                playlist_id=playlist['id'],
-                name=playlist['name'],
-                description=playlist.get('description', 'No description available'),
-                image_url=playlist['images'][0]['url'] if playlist['images'] else None,
-                total_duration_minutes=total_duration_minutes,
-                track_count=len(tracks)
-            )
+                params={'time_range': time_range},
+                user_key=user.id,
+                max_items=capture_limit('top_items')
+            ):
+                writer.add(
+                    Track,
+                    catalog=CatalogTrack(
+                        spotify_id=catalog_id(track['id'], track['name'], track['artists'][0]['name']),
+                        name=track['name'],
+                        artist=track['artists'][0]['name'],
+                        album=track['album']['name'],
+                        image_url=track['album']['images'][0]['url'] if track['album']['images'] else None
+                    ),
+                    popularity=track['popularity']
+                )
+
+        elif wrapper_type == 'TOP_ARTISTS':
+            for artist in iter_items(
+                f'{base_url}/top/artists',
+                headers=headers,
+                params={'time_range': 'short_term'},
+                user_key=user.id,
+                max_items=capture_limit('top_items')
+            ):
+                writer.add(
+                    Artist,
+                    catalog=CatalogArtist(
+                        spotify_id=artist['id'],
+                        name=artist['name'],
+                        image_url=artist['images'][0]['url'] if artist['images'] else None,
+                        genres=artist['genres']
+                    ),
+                    popularity=artist['popularity']
+                )
+
+        elif wrapper_type == 'TOP_ALBUMS':
+            # Computed with the dashboard, only refetched if the aggregate is stale
+            album_info = DashboardAggregate.get_fresh(user, access_token).top_album
+            if album_info:
+                writer.add(
+                    Album,
+                    catalog=CatalogAlbum(
+                        spotify_id=album_info['id'],
+                        name=album_info['name'],
+                        artist=album_info['artist'],
+                        image_url=album_info['image_url'],
+                        release_date=album_info['release_date'],
+                        total_tracks=album_info['total_tracks']
+                    ),
+                    play_count=album_info['play_count']
+                )
+        elif wrapper_type == 'TOP_GENRES':
+            # Genres across all time ranges, shared with the dashboard aggregate
+            aggregate = DashboardAggregate.get_fresh(user, access_token)
+
+            # Save each top genre
+            for genre, count in aggregate.genre_counts[:10]:
+                writer.add(
+                    Genre,
+                    name=genre,
+                    count=count,
+                    # Calculate percentage based on total genre occurrences
+                    percentage=round((count / aggregate.genre_total) * 100, 2)
+                )
+        elif wrapper_type == 'TOP_PLAYLISTS':
+            # Durations come from the dashboard aggregate, already ranked longest first
+            for playlist in DashboardAggregate.get_fresh(user, access_token).ranked_playlists:
+                writer.add(
+                    Playlist,
+                    playlist_id=playlist['id'],
+                    name=playlist['name'],
+                    description=playlist['description'],
+                    image_url=playlist['image_url'],
+                    total_duration_minutes=playlist['duration'],
+                    track_count=playlist['track_count']
+                )
+
+    return writer.spotify_data
+
+def delete_snapshots(snapshots):
+    """
+    Delete a SpotifyData queryset and its children inside a single transaction.
+
+    The child tables have no dependents or signals, so each goes in one
+    DELETE filtered on a subquery, without loading its rows; only the
+    snapshot rows themselves are collected, for their SET_NULL and RESTRICT
+    relations. Returns the rows deleted per model label, like
+    QuerySet.delete(). Repeats of these snapshots outside the queryset must
+    be handed over first (``hand_over_repeats``).
+    """
+    snapshots = snapshots.order_by()
+    snapshot_ids = snapshots.values('id')
+    deleted = {}
+    with transaction.atomic():
+        for relation in SpotifyData.RENDERED_FIELDS:
+            model = SpotifyData._meta.get_field(relation).related_model
+            deleted[model._meta.label] = model.objects.filter(spotify_data__in=snapshot_ids).delete()[0]
+
+        # Repeats inside the set go in the same statement as their source,
+        # which some backends check row by row
+        snapshots.filter(source__isnull=False).update(source=None)
+
+        deleted[SpotifyData._meta.label] = snapshots.delete()[1].get(SpotifyData._meta.label, 0)
+    return deleted
+
+
+def delete_account(user, batch_size=None, progress=None):
+    """
+    Delete ``user`` and all their snapshots.
+
+    Snapshots go ACCOUNT_DELETE_BATCH_SIZE at a time, each batch in its own
+    transaction, newest first so repeats always go before the snapshot they
+    point at. ``progress`` is called with (deleted, total) after each batch.
+    Wrap the call in a transaction to make it all-or-nothing.
+    """
+    batch_size = batch_size or getattr(settings, 'ACCOUNT_DELETE_BATCH_SIZE', 1000)
+    snapshots = SpotifyData.objects.filter(user=user)
+    total = snapshots.count()
+
+    done = 0
+    while True:
+        ids = list(snapshots.order_by('-id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        delete_snapshots(SpotifyData.objects.filter(id__in=ids))
+        done += len(ids)
+        if progress:
+            progress(done, max(done, total))
+
+    user.delete()
+    logger.info(f"Deleted account {user.id} with {done} snapshots")
 
-    return spotify_data
 
 def delete_spotify_wrapper(user, wrapper_type, created_at):
     """
@@ -418,24 +1072,17 @@ def delete_spotify_wrapper(user, wrapper_type, created_at):
         if not wrapper_type_code:
             return None  # Invalid wrapper_type provided
 
-        spotify_data = SpotifyData.objects.filter(
-            user=user,
-            wrapper_type=wrapper_type_code,
-            created_at=created_at
-        ).first()
+        spotify_data = wrap_lookup(user, wrapper_type_code, created_at).first()
 
         if not spotify_data:
             return None  # No data found to delete
 
-        # Delete related data
-        spotify_data.tracks.all().delete()
-        spotify_data.artists.all().delete()
-        spotify_data.albums.all().delete()
-        spotify_data.genres.all().delete()
-        spotify_data.playlists.all().delete()
+        with transaction.atomic():
+            # Later captures identical to this one keep its content
+            spotify_data.hand_over_repeats()
 
-        # Delete the SpotifyData instance
-        spotify_data.delete()
+            # The snapshot and its children, one DELETE per table
+            delete_snapshots(SpotifyData.objects.filter(id=spotify_data.id))
         return spotify_data
 
     except Exception as e:
@@ -451,11 +1098,7 @@ def make_spotify_data_public(user, wrapper_type, created_at):
         if not wrapper_type_code:
             return None  # Invalid wrapper_type provided
 
-        spotify_data = SpotifyData.objects.filter(
-            user=user,
-            wrapper_type=wrapper_type_code,
-            created_at=created_at
-        ).first()
+        spotify_data = wrap_lookup(user, wrapper_type_code, created_at).first()
 
         if not spotify_data:
             return None  # No data found to update
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from . import translator
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+PROMPT = """Based on these songs:
+{}
+
+Generate a fun roughly-50-word personality analysis
+It should describe how someone who listens to this kind of music tends to act/think/dress.
+Keep it positive and playful, focusing on the overall vibe rather than specific songs."""
+
+_model = None
+_model_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# cache key -> Future of the generation this process is running for it
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_model():
+    """The Gemini model, imported and configured once per process."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=settings.CLOUD_API_KEY)
+                _model = genai.GenerativeModel(getattr(settings, 'ANALYSIS_MODEL', 'gemini-pro'))
+    return _model
+
+
+def get_executor():
+    """
+    The pool background analyses run on, kept apart from the Spotify fan-out
+    pool so slow model calls never hold up capture fetches.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ANALYSIS_WORKERS', 2),
+                    thread_name_prefix='analysis',
+                )
+    return _executor
+
+
+def track_set_digest(tracks):
+    """Identifies a set of tracks regardless of the order they're ranked in."""
+    track_ids = sorted(track.get('id') or '' for track in tracks)
+    return hashlib.sha1('|'.join(track_ids).encode()).hexdigest()
+
+
+def cache_key(tracks, language):
+    return f'music_analysis:{track_set_digest(tracks)}:{language}'
+
+
+def build_prompt(tracks):
+    track_info = []
+    for track in tracks:
+        artists = ", ".join(track['artists'])
+        track_info.append(f"{track['name']} by {artists}")
+    return PROMPT.format("\n".join(track_info))
+
+
+def _single_flight(key, compute):
+    """
+    Return the cached value for ``key``, computing it at most once at a time.
+
+    The first caller takes a short-lived cache lock and computes; callers
+    arriving meanwhile (everyone sharing a popular track set) wait for its
+    result instead of calling the model themselves. A waiter that times out
+    gets None rather than piling onto a slow upstream. The lock and the
+    result live in the default cache, so they only reach other processes
+    when CACHES is shared (see REDIS_URL in settings); on the LocMem
+    fallback each process generates on its own.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_timeout = getattr(settings, 'ANALYSIS_LOCK_TIMEOUT', 60)
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, lock_timeout):
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                # The other caller gave up without a result, try ourselves
+                return _single_flight(key, compute)
+        return None
+
+    try:
+        value = compute()
+        if value:
+            cache.set(key, value, getattr(settings, 'ANALYSIS_CACHE_TTL', 60 * 60 * 24))
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def _generate(tracks):
+    response = get_model().generate_content(build_prompt(tracks))
+    return response.text
+
+
+def get_analysis(tracks, language=None):
+    """
+    The personality analysis for ``tracks`` in ``language``, or None on failure.
+
+    Cached per (track set, language) with the final translated text, so a
+    repeat analysis is one cache read. Other languages are translated from
+    the English analysis, which is itself cached and shared between them.
+    """
+    language = language or settings.LANGUAGE_CODE
+    try:
+        cached = cache.get(cache_key(tracks, language))
+        if cached is not None:
+            return cached
+
+        original = _single_flight(cache_key(tracks, settings.LANGUAGE_CODE), lambda: _generate(tracks))
+        if not original or language == settings.LANGUAGE_CODE:
+            return original
+
+        def translated():
+            # None when the translation failed, which isn't cached
+            return translator.translate_many([original], language)[0]
+
+        text = _single_flight(cache_key(tracks, language), translated)
+        if text is None:
+            # Show the English analysis for now and try translating again later
+            cache.set(cache_key(tracks, language), original, getattr(settings, 'ANALYSIS_RETRY_AFTER', 60))
+            return original
+        return text
+    except Exception as e:
+        logger.error(f"Analysis generation error: {str(e)}")
+        return None
+
+
+def _failed_key(tracks, language):
+    return f'{cache_key(tracks, language)}:failed'
+
+
+def _run(tracks, language):
+    try:
+        if get_analysis(tracks, language) is None:
+            # Polls report the failure until it's time to try again
+            cache.set(_failed_key(tracks, language), 1, getattr(settings, 'ANALYSIS_RETRY_AFTER', 60))
+    finally:
+        connections.close_all()
+        with _in_flight_lock:
+            _in_flight.pop(cache_key(tracks, language), None)
+
+
+def request_analysis(tracks, language=None):
+    """
+    Non-blocking ``get_analysis``: returns ('done', text), ('failed', None),
+    or ('pending', None) after making sure a generation is under way.
+
+    At most one background generation per (track set, language) runs in a
+    process. With a shared cache the single-flight lock in ``get_analysis``
+    also keeps other processes from generating the same one, and a poll
+    that lands on another worker picks up its result from the cache.
+    """
+    language = language or settings.LANGUAGE_CODE
+    key = cache_key(tracks, language)
+
+    cached = cache.get(key)
+    if cached is not None:
+        return 'done', cached
+    if cache.get(_failed_key(tracks, language)):
+        return 'failed', None
+
+    with _in_flight_lock:
+        if key not in _in_flight:
+            _in_flight[key] = get_executor().submit(_run, tracks, language)
+    return 'pending', None
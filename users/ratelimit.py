@@ -0,0 +1,153 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from . import http_session
+from .fanout import released_slot
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Classic token bucket. ``reserve`` always takes a token, letting the
+    balance go negative, and returns how long the caller has to wait for
+    it, so concurrent callers are queued in arrival order without polling.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Scheduler:
+    """
+    Paces Spotify API calls through one app-wide bucket, plus one bucket per
+    user when SPOTIFY_USER_RATE is set, and stalls every caller while
+    Spotify's Retry-After is in effect (rate limits are enforced per app, so
+    a 429 for one user applies to all). Callers running on the fan-out pool
+    give their per-user slot back while they wait.
+    """
+
+    def __init__(self):
+        self.app_bucket = TokenBucket(
+            getattr(settings, 'SPOTIFY_APP_RATE', 20),
+            getattr(settings, 'SPOTIFY_APP_BURST', 40),
+        )
+        self.user_buckets = {}
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _user_bucket(self, user_key):
+        """The user's bucket, or None when per-user pacing is off."""
+        rate = getattr(settings, 'SPOTIFY_USER_RATE', None)
+        if rate is None:
+            return None
+        with self.lock:
+            bucket = self.user_buckets.get(user_key)
+            if bucket is None:
+                bucket = TokenBucket(rate, getattr(settings, 'SPOTIFY_USER_BURST', None) or rate * 2)
+                self.user_buckets[user_key] = bucket
+            return bucket
+
+    def wait_turn(self, user_key=None):
+        """Block until this call may go out; returns the seconds waited."""
+        wait = self.app_bucket.reserve()
+        user_bucket = self._user_bucket(user_key) if user_key is not None else None
+        if user_bucket is not None:
+            wait = max(wait, user_bucket.reserve())
+        wait = max(wait, self.blocked_until - time.monotonic())
+
+        if wait > 0:
+            with self.lock:
+                self.waiting += 1
+            try:
+                with released_slot():
+                    time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+
+        wait = max(wait, 0)
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['wait_seconds_total'] += wait
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], wait)
+        return wait
+
+    def throttled(self, retry_after):
+        """Record a 429 and hold everyone back for ``retry_after`` seconds."""
+        with self.lock:
+            self.stats['throttled'] += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def metrics(self):
+        with self.lock:
+            requests = self.stats['requests']
+            return {
+                **self.stats,
+                'queue_depth': self.waiting,
+                'wait_seconds_avg': self.stats['wait_seconds_total'] / requests if requests else 0.0,
+                'blocked_for_seconds': max(self.blocked_until - time.monotonic(), 0),
+            }
+
+
+scheduler = Scheduler()
+
+
+def _retry_after(response, attempt):
+    """Seconds to back off after a 429: Retry-After if given, else exponential, plus jitter."""
+    try:
+        delay = float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        delay = 2 ** attempt
+    return delay + random.uniform(0, 1)
+
+
+def get(url, user_key=None, **kwargs):
+    """
+    Scheduled replacement for ``http_session.get`` for Spotify API calls.
+
+    Waits for a slot in the app and user buckets, then sends the request.
+    A 429 is retried up to SPOTIFY_RATE_LIMIT_RETRIES times after the
+    Retry-After delay, unless that delay exceeds SPOTIFY_RATE_LIMIT_MAX_WAIT,
+    in which case the 429 is handed back rather than tying up the worker.
+    """
+    max_retries = getattr(settings, 'SPOTIFY_RATE_LIMIT_RETRIES', 3)
+    max_wait = getattr(settings, 'SPOTIFY_RATE_LIMIT_MAX_WAIT', 30)
+
+    for attempt in range(max_retries + 1):
+        scheduler.wait_turn(user_key)
+        response = http_session.get(url, **kwargs)
+        if response.status_code != 429:
+            return response
+
+        delay = _retry_after(response, attempt)
+        scheduler.throttled(min(delay, max_wait))
+        logger.warning(f"Spotify rate limited {url}, backing off {delay:.1f}s (attempt {attempt + 1})")
+        if delay > max_wait:
+            break
+
+    return response
@@ -0,0 +1,195 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import ratelimit
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+# Seconds a response stays fresh, by API path prefix (longest match wins).
+# Top items are recomputed by Spotify roughly daily, playlists change when
+# the user edits them (and are revalidated through ETags), recently played
+# changes with every track.
+DEFAULT_TTLS = {
+    'me/top/': 60 * 60 * 6,
+    'me/playlists': 60 * 10,
+    'playlists/': 60 * 10,
+    'search': 60 * 60 * 24,
+    'me/player/recently-played': 60,
+    'me': 60 * 5,
+}
+
+
+class LRUBackend:
+    """In-process LRU, the default. Entries are lost on restart and not shared between workers."""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            # Callers annotate the payloads they get back, keep ours pristine
+            return copy.deepcopy(value)
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (copy.deepcopy(value), time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DjangoCacheBackend:
+    """Stores entries in one of the CACHES aliases."""
+
+    def __init__(self, alias='default'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+
+class RedisBackend:
+    """Stores JSON-encoded entries in Redis so every worker shares one cache."""
+
+    def __init__(self, url='redis://localhost:6379/0'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout):
+        self.client.set(key, json.dumps(value), ex=max(int(timeout), 1))
+
+
+BACKENDS = {
+    'lru': LRUBackend,
+    'django': DjangoCacheBackend,
+    'redis': RedisBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Build the backend named by SPOTIFY_CACHE_BACKEND (an alias above or a dotted path)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'SPOTIFY_CACHE_BACKEND', 'lru')
+                backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+                _backend = backend_class(**getattr(settings, 'SPOTIFY_CACHE_OPTIONS', {}))
+    return _backend
+
+
+def get_ttl(url):
+    """Freshness lifetime for a Spotify API URL, 0 meaning "don't cache"."""
+    path = urlsplit(url).path.split('/v1/', 1)[-1]
+    ttls = {**DEFAULT_TTLS, **getattr(settings, 'SPOTIFY_CACHE_TTLS', {})}
+    matches = [prefix for prefix in ttls if path.startswith(prefix)]
+    return ttls[max(matches, key=len)] if matches else 0
+
+
+def make_key(user_key, url, params=None):
+    """Cache key for (user, endpoint, params); params are sorted so their order doesn't matter."""
+    query = urlencode(sorted((params or {}).items()))
+    digest = hashlib.sha1(f'{url}?{query}'.encode()).hexdigest()
+    return f'spotify:{user_key}:{digest}'
+
+
+class CachedResponse:
+    """The subset of ``requests.Response`` callers use, rebuilt from a cache entry."""
+
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+
+def cached_get(url, headers=None, params=None, user_key=None):
+    """
+    GET a Spotify API URL through the response cache.
+
+    Fresh entries are served without touching the network. Stale entries
+    that carried an ETag are revalidated with If-None-Match, and a 304 just
+    extends their lifetime. Anything other than a 200 is returned as-is and
+    never cached. ``user_key`` should identify the user; when omitted the
+    access token is used so different users can never share entries.
+    """
+    if user_key is None:
+        token = (headers or {}).get('Authorization', '')
+        user_key = hashlib.sha1(token.encode()).hexdigest()
+
+    ttl = get_ttl(url)
+    if not ttl:
+        return ratelimit.get(url, user_key=user_key, headers=headers, params=params)
+
+    backend = get_backend()
+    key = make_key(user_key, url, params)
+    # Entries are kept past their TTL so they can still be revalidated
+    keep_for = ttl + getattr(settings, 'SPOTIFY_CACHE_STALE_SECONDS', 60 * 60 * 24)
+
+    try:
+        entry = backend.get(key)
+    except Exception as e:
+        logger.error(f"Spotify cache read failed: {str(e)}")
+        entry = None
+
+    if entry and entry['fresh_until'] > time.time():
+        return CachedResponse(entry['body'])
+
+    request_headers = dict(headers or {})
+    if entry and entry.get('etag'):
+        request_headers['If-None-Match'] = entry['etag']
+
+    response = ratelimit.get(url, user_key=user_key, headers=request_headers, params=params)
+
+    if response.status_code == 304 and entry:
+        entry['fresh_until'] = time.time() + ttl
+        _store(backend, key, entry, keep_for)
+        return CachedResponse(entry['body'])
+
+    if response.status_code == 200:
+        _store(backend, key, {
+            'body': response.json(),
+            'etag': response.headers.get('ETag'),
+            'fresh_until': time.time() + ttl,
+        }, keep_for)
+
+    return response
+
+
+def _store(backend, key, entry, timeout):
+    try:
+        backend.set(key, entry, timeout)
+    except Exception as e:
+        logger.error(f"Spotify cache write failed: {str(e)}")
@@ -1,34 +1,218 @@
-import requests
+import logging
 from datetime import timedelta
 from django.conf import settings
 
+from . import spotify_cache, tokens
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+# How much of each collection a capture walks through; None means "every page".
+# Override per key with the SPOTIFY_CAPTURE_LIMITS setting.
+DEFAULT_CAPTURE_LIMITS = {
+    'recently_played': 50,  # Spotify only keeps the last 50 plays
+    'top_items': 50,
+    'playlists': 50,
+    'playlist_tracks': None,
+}
+
+
+class SpotifyRequestError(Exception):
+    """A Spotify request failed, so whatever was being built from it is incomplete."""
+
+
+class SpotifyPagingError(SpotifyRequestError):
+    """A page of a Spotify collection couldn't be fetched, so the items seen so far are incomplete."""
+
+
+def capture_limit(name):
+    """Item cap for a collection, see DEFAULT_CAPTURE_LIMITS."""
+    return {**DEFAULT_CAPTURE_LIMITS, **getattr(settings, 'SPOTIFY_CAPTURE_LIMITS', {})}[name]
+
+
+def iter_items(url, headers=None, params=None, user_key=None, max_items=None, page_size=50):
+    """
+    Yield the items of a Spotify paging object, following its ``next`` links.
+
+    Pages are fetched lazily and dropped once consumed, so only one page is
+    ever held in memory. Iteration stops after ``max_items`` items (None for
+    all of them). A non-200 page raises SpotifyPagingError rather than
+    ending early, so callers never mistake a truncated collection for a
+    complete one.
+    """
+    params = dict(params or {})
+    if max_items is not None:
+        page_size = min(page_size, max_items)
+    params.setdefault('limit', page_size)
+
+    yielded = 0
+    while url:
+        response = spotify_cache.cached_get(url, headers=headers, params=params, user_key=user_key)
+        if response.status_code != 200:
+            raise SpotifyPagingError(f"Paging {url} failed after {yielded} items: HTTP {response.status_code}")
+
+        page = response.json()
+        for item in page.get('items', []):
+            yield item
+            yielded += 1
+            if max_items is not None and yielded >= max_items:
+                return
+
+        # The next link already carries the query string
+        url, params = page.get('next'), None
+
+
+def get_playlist_totals(playlist_id, headers, user_key=None):
+    """
+    Return (total duration in minutes, track count) for a playlist, walking
+    every page of its tracks up to the 'playlist_tracks' capture limit.
+    """
+    total_ms, track_count = 0, 0
+    for item in iter_items(
+        f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks',
+        headers=headers,
+        # Only the durations are needed, skip the rest of the track objects
+        params={'fields': 'items(track(duration_ms)),next'},
+        user_key=user_key,
+        max_items=capture_limit('playlist_tracks'),
+        page_size=100,
+    ):
+        track_count += 1
+        if item.get('track'):
+            total_ms += item['track']['duration_ms']  # Duration in milliseconds
+
+    return total_ms / 1000 / 60, track_count  # Convert from ms to minutes
+
+
+def collect_items(url, headers=None, params=None, user_key=None, max_items=None):
+    """Like iter_items, but returns the items as a list."""
+    return list(iter_items(url, headers=headers, params=params, user_key=user_key, max_items=max_items))
+
+
+def _first_image(images):
+    return images[0]['url'] if images else None
+
+
+def compact_track(track):
+    """The fields of a Spotify track object the app renders or stores."""
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artists': [artist['name'] for artist in track['artists']],
+        'album': track['album']['name'],
+        'image_url': _first_image(track['album'].get('images')),
+        'popularity': track.get('popularity', 0),
+        'uri': track.get('uri'),
+        'preview_url': track.get('preview_url'),
+    }
+
+
+def compact_recent(item):
+    """A recently-played item: the compact track plus when it was played."""
+    return {**compact_track(item['track']), 'played_at': item['played_at']}
+
+
+def compact_artist(artist):
+    """The fields of a Spotify artist object the app renders or stores."""
+    return {
+        'id': artist['id'],
+        'name': artist['name'],
+        'image_url': _first_image(artist.get('images')),
+        'genres': artist.get('genres', []),
+        'popularity': artist.get('popularity', 0),
+    }
+
+
+def compact_playlist(playlist, duration, track_count):
+    """A playlist with its total duration in minutes and track count."""
+    return {
+        'id': playlist['id'],
+        'name': playlist['name'],
+        'description': playlist.get('description', 'No description available'),
+        'image_url': _first_image(playlist.get('images')),
+        'duration': duration,
+        'track_count': track_count,
+    }
+
+
+def search_album(album_name, headers, user_key=None):
+    """
+    Look up an album by name and return its compact form, or None if nothing
+    matches. A failed search raises SpotifyRequestError rather than looking
+    like no match.
+    """
+    response = spotify_cache.cached_get(
+        'https://api.spotify.com/v1/search',
+        headers=headers,
+        params={'q': f'album:{album_name}', 'type': 'album', 'limit': 1},
+        user_key=user_key
+    )
+    if response.status_code != 200:
+        raise SpotifyRequestError(f"Album search for {album_name!r} failed: HTTP {response.status_code}")
+
+    album_items = response.json().get('albums', {}).get('items', [])
+    if not album_items:
+        return None
+
+    album_info = album_items[0]
+    return {
+        'id': album_info['id'],
+        'name': album_info['name'],
+        'artist': album_info['artists'][0]['name'] if album_info['artists'] else None,
+        'image_url': _first_image(album_info.get('images')),
+        'release_date': album_info.get('release_date'),
+        'total_tracks': album_info.get('total_tracks', 0),
+    }
+
+
 class SpotifyClient:
-    def __init__(self, access_token, refresh_token=None):
+    def __init__(self, access_token, refresh_token=None, user_id=None):
         self.access_token = access_token
         self.refresh_token = refresh_token
+        self.user_id = user_id
         self.base_url = 'https://api.spotify.com/v1/'
 
-    def _get(self, endpoint, params=None):
+    def _get(self, endpoint, params=None, retry=True):
         headers = {
             'Authorization': f'Bearer {self.access_token}',
         }
-        response = requests.get(self.base_url + endpoint, headers=headers, params=params)
-        if response.status_code == 401:  # Token expired, refresh it
-            self.refresh_access_token()
-            return self._get(endpoint, params)
+        response = spotify_cache.cached_get(
+            self.base_url + endpoint, headers=headers, params=params, user_key=self.user_id
+        )
+        if response.status_code == 401 and retry:  # Token expired, refresh it once
+            if self.refresh_access_token():
+                return self._get(endpoint, params, retry=False)
         return response.json() if response.status_code == 200 else None
 
     def refresh_access_token(self):
-        token_url = 'https://accounts.spotify.com/api/token'
-        data = {
-            'grant_type': 'refresh_token',
-            'refresh_token': self.refresh_token,
-            'client_id': settings.SPOTIFY_CLIENT_ID,
-            'client_secret': settings.SPOTIFY_CLIENT_SECRET,
+        """
+        Replace the rejected access token. Clients bound to a user go through
+        the token manager so concurrent refreshes collapse into one.
+        Returns True if a new token was obtained.
+        """
+        if self.user_id is not None:
+            from .models import User
+
+            user = User.objects.get(id=self.user_id)
+            access_token = tokens.refresh(user, stale_token=self.access_token)
+        else:
+            token_data = tokens.request_token(self.refresh_token)
+            access_token = token_data['access_token'] if token_data else None
+
+        if not access_token:
+            return False
+        self.access_token = access_token
+        return True
+
+    def iter_items(self, endpoint, params=None, max_items=None, page_size=50):
+        """Stream every item of a paged endpoint, see the module-level iter_items."""
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
         }
-        response = requests.post(token_url, data=data)
-        token_data = response.json()
-        self.access_token = token_data['access_token']
+        return iter_items(
+            self.base_url + endpoint, headers=headers, params=params,
+            user_key=self.user_id, max_items=max_items, page_size=page_size
+        )
 
     def get_user_profile(self):
         return self._get('me')
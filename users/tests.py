@@ -0,0 +1,689 @@
+import copy
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Artist, CatalogArtist, CatalogTrack, DashboardAggregate, Genre, IncompleteAggregateError, SnapshotJob,
+    SnapshotWriter, SpotifyData, SpotifyProfile, Track, User,
+    delete_account, delete_snapshots, delete_spotify_wrapper, save_spotify_wrapper
+)
+from . import account_deletion, music_analysis, ratelimit, spotify_cache, tokens, translator
+from .fanout import FanOut
+from .spotify_wrapper import SpotifyPagingError
+from .views import fetch_wraps, public_feed_page
+
+
+class WrapQueryCountTests(TestCase):
+    """Rendering a page of wraps must cost one query per relation present, not per wrap."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='listener', email='listener@example.com', password='pw')
+
+        # Every track snapshot points at the same five catalog tracks
+        tracks = CatalogTrack.objects.bulk_create(
+            CatalogTrack(spotify_id=f't{i}', name=f'Track {i}', artist='Artist', album='Album')
+            for i in range(5)
+        )
+        for wrapper_type in ('RECENTLY_PLAYED', 'TOP_TRACKS_SHORT', 'TOP_TRACKS_LONG'):
+            data = SpotifyData.objects.create(user=cls.user, wrapper_type=wrapper_type, is_public=True)
+            Track.objects.bulk_create(
+                Track(spotify_data=data, catalog=track, rank=i) for i, track in enumerate(tracks, 1)
+            )
+
+        data = SpotifyData.objects.create(user=cls.user, wrapper_type='TOP_ARTISTS', is_public=True)
+        artists = CatalogArtist.objects.bulk_create(
+            CatalogArtist(spotify_id=f'a{i}', name=f'Artist {i}', genres=['pop'])
+            for i in range(5)
+        )
+        Artist.objects.bulk_create(
+            Artist(spotify_data=data, catalog=artist, rank=i) for i, artist in enumerate(artists, 1)
+        )
+
+        data = SpotifyData.objects.create(user=cls.user, wrapper_type='TOP_GENRES', is_public=True)
+        Genre.objects.bulk_create(
+            Genre(spotify_data=data, name=f'genre {i}', count=i, percentage=10)
+            for i in range(5)
+        )
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def render(self, data_entries):
+        """Touch everything the wraps templates touch, so deferred columns would show up as queries."""
+        wraps = fetch_wraps(self.request, data_entries)
+        for wrap in wraps:
+            wrap['username']
+            for relation, fields in SpotifyData.RENDERED_FIELDS.items():
+                for item in wrap.get(relation, []):
+                    for field in fields:
+                        item[field] if isinstance(item, dict) else getattr(item, field)
+        return wraps
+
+    def test_one_query_per_relation_present(self):
+        entries = SpotifyData.objects.filter(user=self.user).select_related('user')
+
+        # entries, tracks (shared by three wrapper types), artists, genres
+        with self.assertNumQueries(4):
+            wraps = self.render(entries)
+
+        self.assertEqual(len(wraps), 5)
+        self.assertEqual(sum(len(wrap.get('tracks', [])) for wrap in wraps), 15)
+
+    def test_single_type_page_skips_other_relations(self):
+        entries = SpotifyData.objects.filter(user=self.user, wrapper_type='TOP_ARTISTS').select_related('user')
+
+        with self.assertNumQueries(2):
+            wraps = self.render(entries)
+
+        self.assertEqual([len(wrap['artists']) for wrap in wraps], [5])
+
+    def test_query_count_does_not_grow_with_wraps(self):
+        track = CatalogTrack.objects.get(spotify_id='t0')
+        for _ in range(10):
+            data = SpotifyData.objects.create(user=self.user, wrapper_type='TOP_TRACKS_MEDIUM', is_public=True)
+            Track.objects.create(spotify_data=data, catalog=track, rank=1)
+
+        entries = SpotifyData.objects.filter(user=self.user).select_related('user')
+        with self.assertNumQueries(4):
+            self.render(entries)
+
+    def test_payload_renders_without_child_queries(self):
+        entries = SpotifyData.objects.filter(user=self.user).select_related('user')
+        from_children = self.render(entries)
+
+        call_command('backfill_wrap_payloads', stdout=StringIO())
+
+        # A fresh queryset, the first one has its children prefetched already
+        with self.assertNumQueries(1):
+            from_payload = self.render(entries.all())
+
+        # Compared as the templates print them, e.g. Decimal percentages come back as strings
+        for joined, denormalized in zip(from_children, from_payload):
+            relation = next(relation for relation in SpotifyData.RENDERED_FIELDS if relation in joined)
+            self.assertEqual(
+                [{field: str(value) for field, value in SpotifyData.payload_item(relation, item).items()}
+                 for item in joined[relation]],
+                [{field: str(value) for field, value in item.items()} for item in denormalized[relation]]
+            )
+
+    def test_outdated_payload_falls_back_to_children(self):
+        call_command('backfill_wrap_payloads', stdout=StringIO())
+        SpotifyData.objects.update(payload_version=SpotifyData.PAYLOAD_VERSION - 1)
+
+        entries = SpotifyData.objects.filter(user=self.user).select_related('user')
+        with self.assertNumQueries(4):
+            self.render(entries)
+
+    @override_settings(PUBLIC_FEED_PAGE_SIZE=2)
+    def test_public_feed_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                entries, cursor = public_feed_page(cursor)
+            seen.extend(entry.id for entry in entries)
+            if cursor is None:
+                break
+
+        expected = SpotifyData.objects.filter(is_public=True).order_by('-created_at', '-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+
+class SnapshotDedupeTests(TestCase):
+    """A capture identical to the previous one is stored as a pointer but listed as its own wrap."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='repeater', email='repeater@example.com', password='pw')
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def capture(self, genres):
+        with SnapshotWriter(self.user, 'TOP_GENRES') as writer:
+            for name, count in genres:
+                writer.add(Genre, name=name, count=count, percentage=50)
+        return writer.spotify_data
+
+    def test_unchanged_capture_is_a_pointer(self):
+        first = self.capture([('pop', 2), ('rock', 1)])
+        second = self.capture([('pop', 2), ('rock', 1)])
+        third = self.capture([('pop', 2), ('rock', 1)])
+
+        self.assertIsNone(first.source_id)
+        self.assertEqual(second.source_id, first.id)
+        self.assertEqual(third.source_id, first.id)
+        self.assertEqual(Genre.objects.count(), 2)
+
+        wraps = fetch_wraps(self.request, SpotifyData.objects.filter(user=self.user).select_related('user'))
+        self.assertEqual(len(wraps), 3)
+        self.assertEqual([[item['name'] for item in wrap['genres']] for wrap in wraps], [['pop', 'rock']] * 3)
+
+    def test_changed_capture_is_stored(self):
+        first = self.capture([('pop', 2), ('rock', 1)])
+        second = self.capture([('pop', 3), ('rock', 1)])
+
+        self.assertIsNone(second.source_id)
+        self.assertEqual(Genre.objects.filter(spotify_data=second).count(), 2)
+        # Only the latest capture is compared against
+        self.assertEqual(self.capture([('pop', 2), ('rock', 1)]).source_id, None)
+        self.assertIsNone(first.source_id)
+
+    def test_deleting_the_source_keeps_its_repeats(self):
+        first = self.capture([('pop', 2)])
+        second = self.capture([('pop', 2)])
+        third = self.capture([('pop', 2)])
+
+        delete_spotify_wrapper(self.user, 'TOP_GENRES', first.created_at)
+
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertIsNone(second.source_id)
+        self.assertEqual(third.source_id, second.id)
+        self.assertEqual(list(second.genres.values_list('name', flat=True)), ['pop'])
+
+        wraps = fetch_wraps(self.request, SpotifyData.objects.filter(user=self.user).select_related('user'))
+        self.assertEqual([[item['name'] for item in wrap['genres']] for wrap in wraps], [['pop']] * 2)
+
+
+@override_settings(SNAPSHOT_RETENTION={'default': {'keep_all_days': 30, 'thin_to': 'week'}}, SNAPSHOT_DEDUPE=False)
+class CompactWrapsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='hoarder', email='hoarder@example.com', password='pw')
+
+    def capture(self, days_ago, is_public=False):
+        with SnapshotWriter(self.user, 'TOP_GENRES') as writer:
+            writer.add(Genre, name='pop', count=1, percentage=100)
+        SpotifyData.objects.filter(id=writer.spotify_data.id).update(
+            created_at=timezone.now() - timedelta(days=days_ago), is_public=is_public
+        )
+        return writer.spotify_data.id
+
+    def test_old_private_wraps_are_thinned_to_one_per_week(self):
+        recent = [self.capture(days) for days in (1, 2, 3)]
+        # Two per day for two weeks, well past keep_all_days
+        old = [self.capture(days) for days in range(100, 114) for _ in range(2)]
+        public = self.capture(105, is_public=True)
+
+        out = StringIO()
+        call_command('compact_wraps', '--dry-run', stdout=out)
+        self.assertEqual(SpotifyData.objects.count(), len(recent) + len(old) + 1)
+
+        call_command('compact_wraps', '--batch-size', '5', stdout=out)
+        remaining = set(SpotifyData.objects.values_list('id', flat=True))
+
+        self.assertTrue(set(recent) <= remaining)
+        self.assertIn(public, remaining)
+        # Fourteen days span two or three ISO weeks
+        self.assertIn(len(remaining & set(old)), (2, 3))
+        self.assertEqual(Genre.objects.count(), len(remaining))
+
+    @override_settings(SNAPSHOT_RETENTION={'default': {'keep_all_days': 30, 'thin_to': None}})
+    def test_kept_repeat_inherits_from_expired_source(self):
+        with override_settings(SNAPSHOT_DEDUPE=True):
+            self.capture(100)
+            repeat = self.capture(1)
+
+        out = StringIO()
+        call_command('compact_wraps', '--dry-run', stdout=out)
+        self.assertIn('Would delete 1 users.SpotifyData rows', out.getvalue())
+        self.assertNotIn('users.Genre', out.getvalue())
+
+        call_command('compact_wraps', stdout=StringIO())
+
+        self.assertEqual(list(SpotifyData.objects.values_list('id', 'source')), [(repeat, None)])
+        self.assertEqual(Genre.objects.get().spotify_data_id, repeat)
+
+    def test_prune_catalog_skips_recently_upserted_rows(self):
+        stale, fresh = CatalogArtist.objects.bulk_create(
+            [CatalogArtist(spotify_id='stale', name='Stale'), CatalogArtist(spotify_id='fresh', name='Fresh')]
+        )
+        CatalogArtist.objects.filter(id=stale.id).update(last_seen_at=timezone.now() - timedelta(hours=2))
+
+        call_command('compact_wraps', '--prune-catalog', stdout=StringIO())
+
+        self.assertEqual(list(CatalogArtist.objects.values_list('spotify_id', flat=True)), ['fresh'])
+
+
+class FastDeleteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leaver', email='leaver@example.com', password='pw')
+
+    def capture(self, genres):
+        with SnapshotWriter(self.user, 'TOP_GENRES') as writer:
+            for name in genres:
+                writer.add(Genre, name=name, count=1, percentage=10)
+        return writer.spotify_data
+
+    def test_delete_snapshots_clears_children_and_jobs(self):
+        kept = self.capture(['pop'])
+        gone = self.capture(['rock', 'jazz'])
+        job = SnapshotJob.objects.create(user=self.user, wrapper_type='TOP_GENRES', status='DONE', spotify_data=gone)
+
+        deleted = delete_snapshots(SpotifyData.objects.filter(id=gone.id))
+
+        self.assertEqual(deleted['users.SpotifyData'], 1)
+        self.assertEqual(deleted['users.Genre'], 2)
+        self.assertEqual(list(SpotifyData.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(list(Genre.objects.values_list('name', flat=True)), ['pop'])
+        job.refresh_from_db()
+        self.assertIsNone(job.spotify_data_id)
+
+    def test_delete_account_in_batches(self):
+        for genres in (['pop'], ['pop'], ['rock'], ['rock'], ['jazz']):
+            self.capture(genres)
+        self.assertTrue(SpotifyData.objects.filter(source__isnull=False).exists())
+
+        progress = []
+        delete_account(self.user, batch_size=2, progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        self.assertFalse(User.objects.filter(id=self.user.id).exists())
+        self.assertFalse(SpotifyData.objects.exists())
+        self.assertFalse(Genre.objects.exists())
+
+    def test_interrupted_background_deletion_is_finished(self):
+        self.capture(['pop'])
+        other = User.objects.create_user(username='stayer', email='stayer@example.com', password='pw')
+        User.objects.filter(id=self.user.id).update(
+            is_active=False, deletion_requested_at=timezone.now() - timedelta(hours=2)
+        )
+
+        call_command('finish_account_deletions', stdout=StringIO())
+
+        self.assertEqual(list(User.objects.values_list('id', flat=True)), [other.id])
+        self.assertFalse(SpotifyData.objects.exists())
+
+    def test_deletion_status_survives_a_lost_cache(self):
+        self.capture(['pop'])
+        with mock.patch.object(account_deletion, 'get_executor'):
+            deletion_id = account_deletion.start(self.user)
+        self.assertEqual(account_deletion.progress(deletion_id)['status'], 'pending')
+
+        # Another worker, or this one after a restart
+        with mock.patch.object(account_deletion, 'cache', mock.Mock(get=mock.Mock(return_value=None))):
+            self.assertEqual(
+                account_deletion.progress(deletion_id), {'status': 'running', 'deleted': None, 'total': None}
+            )
+            delete_account(self.user)
+            self.assertEqual(account_deletion.progress(deletion_id)['status'], 'done')
+
+        self.assertIsNone(account_deletion.progress('not-a-deletion'))
+        self.assertIsNone(account_deletion.progress(account_deletion.signing.dumps(self.user.id)))
+
+
+class SpotifyProfileTests(TestCase):
+    def test_user_row_has_no_top_track_blobs(self):
+        columns = [field.column for field in User._meta.concrete_fields]
+        self.assertFalse([column for column in columns if 'top_tracks' in column])
+
+    def test_clearing_spotify_data_drops_the_profile(self):
+        user = User.objects.create_user(username='profiled', email='profiled@example.com', password='pw')
+        SpotifyProfile.objects.create(user=user, top_tracks_short=[{'id': 't'}])
+
+        self.assertTrue(user.clear_spotify_data())
+        self.assertFalse(SpotifyProfile.objects.filter(user=user).exists())
+
+
+class TranslateManyTests(TestCase):
+    def test_failure_is_none_but_identical_translation_is_kept(self):
+        class EchoBackend:
+            def translate(self, texts, language, format='text'):
+                return list(texts)
+
+        with mock.patch.object(translator, 'get_backend', return_value=EchoBackend()):
+            self.assertEqual(translator.translate_many(['Spotify echo', ''], 'fr'), ['Spotify echo', ''])
+
+        failing = mock.Mock()
+        failing.translate.side_effect = RuntimeError('down')
+        with mock.patch.object(translator, 'get_backend', return_value=failing):
+            self.assertEqual(translator.translate_many(['never translated'], 'fr'), [None])
+            self.assertEqual(translator.translate('never translated', 'fr'), 'never translated')
+
+    def test_offline_backends_do_not_share_the_cache(self):
+        with mock.patch.object(translator, 'get_backend', return_value=translator.DictBackend()):
+            self.assertEqual(translator.translate('shared cache line', 'fr'), '[fr] shared cache line')
+
+        real = mock.Mock(namespace='')
+        real.translate.return_value = ['ligne de cache partagée']
+        with mock.patch.object(translator, 'get_backend', return_value=real):
+            self.assertEqual(translator.translate('shared cache line', 'fr'), 'ligne de cache partagée')
+        real.translate.assert_called_once()
+
+    def test_benchmark_stays_offline_by_default(self):
+        out = StringIO()
+        with mock.patch.object(translator.GoogleBackend, 'translate', side_effect=AssertionError('went online')):
+            call_command('benchmark_translations', '--requests', '5', '--vocabulary', '10', stdout=out)
+
+        self.assertIn('Backend: DictBackend', out.getvalue())
+        self.assertIn('0 errors', out.getvalue())
+
+
+class AnalysisStatusTests(TestCase):
+    tracks = [{'id': 'status-track', 'name': 'Song', 'artists': ['Band']}]
+
+    def poll(self, language):
+        status, text = music_analysis.request_analysis(self.tracks, language)
+        future = music_analysis._in_flight.get(music_analysis.cache_key(self.tracks, language))
+        if future:
+            future.result()
+        return status, text
+
+    def test_failed_translation_falls_back_to_english(self):
+        with mock.patch.object(music_analysis, '_generate', return_value='Upbeat and bold.'), \
+                mock.patch.object(translator, 'translate_many', return_value=[None]):
+            self.assertEqual(self.poll('es'), ('pending', None))
+            self.assertEqual(music_analysis.request_analysis(self.tracks, 'es'), ('done', 'Upbeat and bold.'))
+
+
+@override_settings(SPOTIFY_CAPTURE_LIMITS={'top_items': None})
+class TruncatedCaptureTests(TestCase):
+    def test_failed_page_saves_nothing(self):
+        user = User.objects.create_user(username='paged', email='paged@example.com', password='pw')
+        artist = {'id': 'a1', 'name': 'Band', 'images': [], 'genres': [], 'popularity': 1}
+        first_page = mock.Mock(status_code=200)
+        first_page.json.return_value = {'items': [artist], 'next': 'https://api.spotify.com/v1/me/top/artists?offset=1'}
+        pages = [first_page, mock.Mock(status_code=502)]
+
+        with mock.patch.object(spotify_cache, 'cached_get', side_effect=pages):
+            with self.assertRaises(SpotifyPagingError):
+                save_spotify_wrapper(user, 'token', 'TOP_ARTISTS')
+
+        self.assertFalse(SpotifyData.objects.exists())
+        self.assertFalse(Artist.objects.exists())
+
+
+class SpotifyCacheTests(TestCase):
+    url = 'https://api.spotify.com/v1/me/top/tracks'
+
+    def setUp(self):
+        self.backend = spotify_cache.LRUBackend()
+        patcher = mock.patch.object(spotify_cache, 'get_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status_code, body=None, etag=None):
+        response = mock.Mock(status_code=status_code, headers={'ETag': etag} if etag else {})
+        response.json.return_value = body
+        return response
+
+    def test_fresh_entry_is_served_without_a_request(self):
+        with mock.patch.object(spotify_cache.ratelimit, 'get', return_value=self.response(200, {'items': [1]})) as get:
+            first = spotify_cache.cached_get(self.url, user_key=1)
+            second = spotify_cache.cached_get(self.url, user_key=1)
+            # Entries are per user
+            spotify_cache.cached_get(self.url, user_key=2)
+
+        self.assertEqual((first.json(), second.json()), ({'items': [1]}, {'items': [1]}))
+        self.assertEqual(get.call_count, 2)
+
+    def test_stale_entry_is_revalidated_with_its_etag(self):
+        with mock.patch.object(spotify_cache.ratelimit, 'get', return_value=self.response(200, {'items': [1]}, 'v1')):
+            spotify_cache.cached_get(self.url, user_key=1)
+
+        key = spotify_cache.make_key(1, self.url)
+        entry = self.backend.get(key)
+        entry['fresh_until'] = 0
+        self.backend.set(key, entry, 60)
+
+        with mock.patch.object(spotify_cache.ratelimit, 'get', return_value=self.response(304)) as get:
+            response = spotify_cache.cached_get(self.url, user_key=1)
+            # The 304 made the entry fresh again
+            spotify_cache.cached_get(self.url, user_key=1)
+
+        self.assertEqual(response.json(), {'items': [1]})
+        get.assert_called_once()
+        self.assertEqual(get.call_args.kwargs['headers']['If-None-Match'], 'v1')
+
+    def test_errors_are_not_cached(self):
+        with mock.patch.object(spotify_cache.ratelimit, 'get', return_value=self.response(429)) as get:
+            self.assertEqual(spotify_cache.cached_get(self.url, user_key=1).status_code, 429)
+            spotify_cache.cached_get(self.url, user_key=1)
+
+        self.assertEqual(get.call_count, 2)
+
+    def test_uncached_paths_go_straight_out(self):
+        self.assertEqual(spotify_cache.get_ttl('https://api.spotify.com/v1/audio-features'), 0)
+        self.assertEqual(spotify_cache.get_ttl('https://api.spotify.com/v1/me/top/artists'), 60 * 60 * 6)
+        self.assertEqual(spotify_cache.get_ttl('https://api.spotify.com/v1/me'), 60 * 5)
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokened', email='tokened@example.com', password='pw')
+        self.user.spotify_access_token = 'expired'
+        self.user.spotify_refresh_token = 'refresh'
+        self.user.spotify_token_expires = timezone.now() - timedelta(minutes=1)
+        self.addCleanup(tokens.forget, self.user.id)
+
+        def store(user, access_token, refresh_token, expires_in):
+            user.spotify_access_token = access_token
+            user.spotify_token_expires = timezone.now() + timedelta(seconds=expires_in)
+            return True
+
+        # Stored on the instance only, so the threads below never need the database
+        patcher = mock.patch.object(User, 'set_spotify_tokens', autospec=True, side_effect=store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def slow_token(self, *args):
+        time.sleep(0.2)
+        return {'access_token': 'fresh', 'expires_in': 3600}
+
+    def test_concurrent_refreshes_share_one_request(self):
+        results = []
+        with mock.patch.object(tokens, 'request_token', side_effect=self.slow_token) as request_token:
+            # Each request thread has its own copy of the user, as separate requests would
+            threads = [
+                threading.Thread(target=lambda user: results.append(tokens.refresh(user)), args=(copy.copy(self.user),))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        request_token.assert_called_once()
+        self.assertEqual(results, ['fresh'] * 5)
+
+    def test_rejected_token_is_replaced_before_expiry(self):
+        with mock.patch.object(tokens, 'request_token', side_effect=self.slow_token) as request_token:
+            self.assertEqual(tokens.refresh(self.user), 'fresh')
+            # Still valid for an hour, so only a 401 makes it refresh again
+            self.assertEqual(tokens.refresh(self.user), 'fresh')
+            request_token.return_value = None
+            request_token.side_effect = None
+            self.assertIsNone(tokens.refresh(self.user, stale_token='fresh'))
+
+        self.assertEqual(request_token.call_count, 2)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.scheduler = ratelimit.Scheduler()
+        for patcher in (
+            mock.patch.object(ratelimit, 'scheduler', self.scheduler),
+            mock.patch.object(ratelimit.random, 'uniform', return_value=0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def response(self, status_code, retry_after=None):
+        return mock.Mock(status_code=status_code, headers={'Retry-After': retry_after} if retry_after else {})
+
+    def test_429_is_retried_after_retry_after(self):
+        responses = [self.response(429, '0.1'), self.response(200)]
+        with mock.patch.object(ratelimit.http_session, 'get', side_effect=responses) as get:
+            started = time.monotonic()
+            self.assertEqual(ratelimit.get('https://api.spotify.com/v1/me', user_key=1).status_code, 200)
+
+        self.assertEqual(get.call_count, 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(self.scheduler.metrics()['throttled'], 1)
+
+    @override_settings(SPOTIFY_RATE_LIMIT_MAX_WAIT=30)
+    def test_long_retry_after_is_handed_back(self):
+        with mock.patch.object(ratelimit.http_session, 'get', return_value=self.response(429, '120')) as get:
+            self.assertEqual(ratelimit.get('https://api.spotify.com/v1/me', user_key=1).status_code, 429)
+
+        get.assert_called_once()
+        # Everyone else holds back for at most the cap
+        self.assertLessEqual(self.scheduler.metrics()['blocked_for_seconds'], 30)
+
+    def test_no_per_user_pacing_by_default(self):
+        self.assertIsNone(self.scheduler._user_bucket(1))
+        with override_settings(SPOTIFY_USER_RATE=50, SPOTIFY_USER_BURST=None):
+            self.assertEqual(self.scheduler._user_bucket(1).capacity, 100)
+
+    @override_settings(SPOTIFY_FANOUT_PER_USER=1)
+    def test_waiting_call_gives_its_fanout_slot_back(self):
+        finished = []
+        holding = threading.Event()
+        self.scheduler.throttled(0.3)
+
+        def throttled_call():
+            holding.set()
+            self.scheduler.wait_turn('slot-user')
+            finished.append('throttled')
+
+        fanout = FanOut('slot-user')
+        fanout.submit('throttled', throttled_call)
+        holding.wait()
+        fanout.submit('other', finished.append, 'other')
+        fanout.results()
+
+        self.assertEqual(finished, ['other', 'throttled'])
+
+
+class SnapshotJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', email='queued@example.com', password='pw')
+        patcher = mock.patch.object(tokens, 'get_access_token', return_value='token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_requests_share_one_job(self):
+        job = SnapshotJob.enqueue(self.user, 'TOP_GENRES')
+        self.assertEqual(SnapshotJob.enqueue(self.user, 'TOP_GENRES'), job)
+        self.assertNotEqual(SnapshotJob.enqueue(self.user, 'TOP_ARTISTS'), job)
+
+        self.assertTrue(job.claim())
+        self.assertFalse(SnapshotJob.objects.get(id=job.id).claim())
+        # Still in flight while it runs
+        self.assertEqual(SnapshotJob.enqueue(self.user, 'TOP_GENRES'), job)
+
+    def test_enqueue_after_a_competing_job_finished(self):
+        # The competing job got the slot, then finished before we could read it back
+        race = [IntegrityError('unique_in_flight_snapshot_job'), mock.DEFAULT]
+        with mock.patch.object(
+            SnapshotJob.objects, 'create', side_effect=race, wraps=SnapshotJob.objects.create
+        ) as create:
+            job = SnapshotJob.enqueue(self.user, 'TOP_GENRES')
+
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(job.status, 'QUEUED')
+        self.assertTrue(SnapshotJob.objects.filter(id=job.id).exists())
+
+    @override_settings(SNAPSHOT_JOB_MAX_ATTEMPTS=2)
+    def test_database_errors_are_retried_then_fail(self):
+        job = SnapshotJob.enqueue(self.user, 'TOP_GENRES')
+        locked = OperationalError('database is locked')
+
+        with mock.patch('users.models.save_spotify_wrapper', side_effect=locked):
+            self.assertTrue(job.claim())
+            job.run()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+
+            self.assertTrue(job.claim())
+            job.run()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.error), ('FAILED', 2, 'database is locked'))
+
+    def test_other_errors_fail_at_once(self):
+        job = SnapshotJob.enqueue(self.user, 'TOP_GENRES')
+
+        with mock.patch('users.models.save_spotify_wrapper', side_effect=ValueError('bad payload')):
+            job.claim()
+            job.run()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 1))
+
+
+class DashboardAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dashboard', email='dashboard@example.com', password='pw')
+
+    def collect_items(self, url, *args, **kwargs):
+        if url.endswith('/me/playlists'):
+            raise SpotifyPagingError(f"Paging {url} failed after 0 items: HTTP 429")
+        return []
+
+    def test_failed_call_is_neither_stored_nor_captured(self):
+        with mock.patch('users.models.collect_items', side_effect=self.collect_items):
+            with self.assertRaises(IncompleteAggregateError) as raised:
+                DashboardAggregate.refresh(self.user, 'token')
+            self.assertEqual(raised.exception.failed, ['playlists'])
+            self.assertEqual(raised.exception.aggregate.ranked_playlists, [])
+            self.assertFalse(DashboardAggregate.objects.exists())
+
+            job = SnapshotJob.enqueue(self.user, 'TOP_PLAYLISTS')
+            job.claim()
+            with mock.patch.object(tokens, 'get_access_token', return_value='token'):
+                job.run()
+
+        self.assertEqual(job.status, 'FAILED')
+        self.assertFalse(SpotifyData.objects.exists())
+
+    def test_dashboard_shows_partial_data_with_a_notice(self):
+        self.client.force_login(self.user)
+        with mock.patch('users.models.collect_items', side_effect=self.collect_items), \
+                mock.patch.object(tokens, 'get_access_token', return_value='token'):
+            response = self.client.get(reverse('dashboard'), secure=True)
+
+        self.assertTrue(response.context['degraded'])
+        self.assertTrue(response.context['spotify_connected'])
+        self.assertNotIn('dashboard_state', self.client.session)
+
+    def test_complete_refresh_is_stored(self):
+        with mock.patch('users.models.collect_items', return_value=[]):
+            aggregate = DashboardAggregate.get_fresh(self.user, 'token')
+
+        self.assertEqual(DashboardAggregate.objects.get(), aggregate)
+        self.assertTrue(aggregate.is_fresh())
+
+    def test_concurrent_refreshes_share_one_fetch(self):
+        def slow_fetch(user, access_token):
+            time.sleep(0.2)
+            return mock.sentinel.aggregate
+
+        results = []
+        with mock.patch.object(DashboardAggregate, '_fetch', side_effect=slow_fetch) as fetch:
+            threads = [
+                threading.Thread(target=lambda: results.append(DashboardAggregate.refresh(self.user, 'token')))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        fetch.assert_called_once()
+        self.assertEqual(results, [mock.sentinel.aggregate] * 4)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command('audit_query_plans', stdout=out)
+        self.assertIn('public feed, later page: OK', out.getvalue())
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from . import http_session
+from .fanout import get_executor
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+# user id -> (access token, expiry datetime), newest token this process has seen
+_tokens = {}
+_tokens_lock = threading.Lock()
+# user id -> lock, so only one thread per process refreshes a given user
+_refresh_locks = {}
+_refresh_locks_lock = threading.Lock()
+
+
+def _skew():
+    """Tokens this close to expiry are treated as expired."""
+    return timedelta(seconds=getattr(settings, 'SPOTIFY_TOKEN_SKEW_SECONDS', 60))
+
+
+def _refresh_ahead():
+    """Tokens this close to expiry are still served but renewed in the background."""
+    return timedelta(seconds=getattr(settings, 'SPOTIFY_TOKEN_REFRESH_AHEAD_SECONDS', 600))
+
+
+def _refresh_lock(user_id):
+    with _refresh_locks_lock:
+        return _refresh_locks.setdefault(user_id, threading.Lock())
+
+
+def _current(user):
+    """The freshest (token, expiry) known for the user, from memory or the user row."""
+    token, expires = user.spotify_access_token, user.spotify_token_expires
+    with _tokens_lock:
+        cached = _tokens.get(user.id)
+    if cached and (expires is None or cached[1] > expires):
+        token, expires = cached
+    return token, expires
+
+
+def _remember(user_id, token, expires):
+    with _tokens_lock:
+        _tokens[user_id] = (token, expires)
+
+
+def forget(user_id):
+    """Drop a user's cached token, e.g. after they disconnect Spotify."""
+    with _tokens_lock:
+        _tokens.pop(user_id, None)
+
+
+def request_token(refresh_token):
+    """
+    Exchange a refresh token at the accounts endpoint.
+
+    Network errors, 5xx and 429 responses are retried with exponential
+    backoff up to SPOTIFY_TOKEN_MAX_RETRIES times. Any other error (e.g. a
+    revoked refresh token) fails immediately. Returns the token payload or None.
+    """
+    max_retries = getattr(settings, 'SPOTIFY_TOKEN_MAX_RETRIES', 3)
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        try:
+            response = http_session.post(
+                TOKEN_URL,
+                data={
+                    'grant_type': 'refresh_token',
+                    'refresh_token': refresh_token,
+                    'client_id': settings.SPOTIFY_CLIENT_ID,
+                    'client_secret': settings.SPOTIFY_CLIENT_SECRET
+                },
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+        except Exception as e:
+            logger.warning(f"Token request failed (attempt {attempt + 1}): {str(e)}")
+            continue
+
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code != 429 and response.status_code < 500:
+            logger.error(f"Token endpoint rejected refresh: HTTP {response.status_code}")
+            return None
+        logger.warning(f"Token endpoint returned HTTP {response.status_code} (attempt {attempt + 1})")
+
+    return None
+
+
+def refresh(user, window=None, stale_token=None):
+    """
+    Refresh the user's access token, single-flight per user.
+
+    Threads in this process queue on a per-user lock, and other processes
+    are kept out by a short-lived lock in the default cache, which only
+    reaches them when CACHES is shared (see REDIS_URL in settings). Whoever
+    comes second finds the new token already in place and returns it
+    without calling Spotify.
+    A token with more than ``window`` left (the skew window by default) is
+    returned as-is, unless it is ``stale_token``, one Spotify has just
+    rejected with a 401. Returns the access token, or None on failure.
+    """
+    window = _skew() if window is None else window
+    with _refresh_lock(user.id):
+        token, expires = _current(user)
+        if token and token != stale_token and expires and expires - timezone.now() > window:
+            return token
+
+        lock_key = f'spotify_token_refresh_{user.id}'
+        acquired = cache.add(lock_key, 1, 30)
+        if not acquired:
+            # Another process is refreshing, give it a moment and pick up its result
+            token = _wait_for_other_process(user)
+            if token:
+                return token
+
+        try:
+            token_data = request_token(user.spotify_refresh_token)
+            if not token_data:
+                logger.error(f"Failed to refresh token for user {user.id}")
+                return None
+
+            success = user.set_spotify_tokens(
+                access_token=token_data['access_token'],
+                refresh_token=token_data.get('refresh_token', user.spotify_refresh_token),
+                expires_in=token_data['expires_in']
+            )
+            if not success:
+                return None
+
+            _remember(user.id, user.spotify_access_token, user.spotify_token_expires)
+            return user.spotify_access_token
+        finally:
+            if acquired:
+                cache.delete(lock_key)
+
+
+def _wait_for_other_process(user, timeout=5):
+    from .models import User
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.25)
+        row = User.objects.filter(id=user.id).values(
+            'spotify_access_token', 'spotify_refresh_token', 'spotify_token_expires'
+        ).first()
+        if row and row['spotify_token_expires'] and row['spotify_token_expires'] - timezone.now() > _skew():
+            user.spotify_access_token = row['spotify_access_token']
+            user.spotify_refresh_token = row['spotify_refresh_token']
+            user.spotify_token_expires = row['spotify_token_expires']
+            _remember(user.id, user.spotify_access_token, user.spotify_token_expires)
+            return user.spotify_access_token
+    return None
+
+
+def _refresh_in_background(user_id):
+    from .models import User
+
+    try:
+        # Work on our own copy, the request thread keeps using its instance
+        refresh(User.objects.get(id=user_id), window=_refresh_ahead())
+    except Exception as e:
+        logger.error(f"Background token refresh failed for user {user_id}: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def get_access_token(user):
+    """
+    Return a usable access token for the user.
+
+    Only blocks on a refresh when the token is missing, expired or within
+    the skew window. A token inside the refresh-ahead window is returned
+    immediately while a background refresh renews it.
+    """
+    token, expires = _current(user)
+    if not token:
+        return None
+    if expires is None:
+        return token
+
+    remaining = expires - timezone.now()
+    if remaining <= _skew():
+        return refresh(user)
+
+    if remaining <= _refresh_ahead() and not _refresh_lock(user.id).locked():
+        get_executor().submit(_refresh_in_background, user.id)
+    return token
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import translation
+from django.utils.module_loading import import_string
+
+from . import http_session
+from .models import Translation
+from .spotify_cache import LRUBackend
+
+# Setting up a logger
+logger = logging.getLogger(__name__)
+
+GOOGLE_TRANSLATE_URL = 'https://translation.googleapis.com/language/translate/v2'
+
+# Google accepts at most 128 q values per request
+MAX_BATCH_SIZE = 128
+
+# Entries never expire, translations of a given text don't change
+_FOREVER = 60 * 60 * 24 * 365
+
+_memory = LRUBackend(max_entries=getattr(settings, 'TRANSLATION_CACHE_SIZE', 2000))
+
+# Where translations came from, to measure cache hit rates
+_stats = {
+    'catalog_hits': 0,
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'upstream_requests': 0,
+    'upstream_errors': 0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+
+def metrics():
+    with _stats_lock:
+        lookups = _stats['catalog_hits'] + _stats['memory_hits'] + _stats['db_hits'] + _stats['misses']
+        hits = lookups - _stats['misses']
+        return {**_stats, 'hit_rate': hits / lookups if lookups else 0.0}
+
+
+def pseudo_translate(text, language):
+    """Deterministic fake translation used by the offline backends."""
+    return f'[{language}] {text}'
+
+
+class GoogleBackend:
+    """Google Cloud Translation v2, the default."""
+
+    # Cached translations are kept apart per namespace, so pseudo-translations
+    # from the offline backends never stand in for real ones. Google's is
+    # empty, which keeps the hashes cached before namespaces existed.
+    namespace = ''
+
+    def __init__(self, url=GOOGLE_TRANSLATE_URL, api_key=None):
+        self.url = url
+        self.api_key = api_key
+
+    def translate(self, texts, language, format='text'):
+        """One request for up to MAX_BATCH_SIZE texts; returns the translations in order."""
+        response = http_session.post(
+            self.url,
+            params={'key': self.api_key or settings.CLOUD_API_KEY},
+            data={
+                'q': texts,
+                'target': language,
+                'format': format,
+            }
+        )
+        response.raise_for_status()
+        return [item['translatedText'] for item in response.json()['data']['translations']]
+
+
+class LocalBackend(GoogleBackend):
+    """
+    Speaks the Google protocol to the stand-in started by
+    ``manage.py translation_standin``, for load tests without network access.
+    """
+
+    namespace = 'local'
+
+    def __init__(self, url='http://127.0.0.1:8765/language/translate/v2', api_key='local'):
+        super().__init__(url=url, api_key=api_key)
+
+
+class DictBackend:
+    """
+    In-process backend: looks texts up in ``translations`` ({language: {text: translation}})
+    and pseudo-translates the rest. Never touches the network.
+    """
+
+    namespace = 'dict'
+
+    def __init__(self, translations=None):
+        self.translations = translations or {}
+
+    def translate(self, texts, language, format='text'):
+        known = self.translations.get(language, {})
+        return [known.get(text) or pseudo_translate(text, language) for text in texts]
+
+
+BACKENDS = {
+    'google': GoogleBackend,
+    'local': LocalBackend,
+    'dict': DictBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Build the backend named by TRANSLATION_BACKEND (an alias above or a dotted path)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'TRANSLATION_BACKEND', 'google')
+                backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+                _backend = backend_class(**getattr(settings, 'TRANSLATION_BACKEND_OPTIONS', {}))
+    return _backend
+
+
+@contextmanager
+def using_backend(backend):
+    """Send translations through ``backend`` instead of TRANSLATION_BACKEND inside the block."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    try:
+        yield backend
+    finally:
+        with _backend_lock:
+            _backend = previous
+
+
+def cache_namespace():
+    """Namespace of the configured backend; backends that don't set one get their class path."""
+    backend = get_backend()
+    return getattr(backend, 'namespace', f'{type(backend).__module__}.{type(backend).__qualname__}')
+
+
+def _hash(text, format='text'):
+    # HTML-format results are escaped differently, so they're cached separately
+    if format != 'text':
+        text = f'{format}:{text}'
+    namespace = cache_namespace()
+    if namespace:
+        text = f'{namespace}|{text}'
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _memory_key(source_hash, language):
+    return f'{language}:{source_hash}'
+
+
+def from_catalog(text, language):
+    """
+    The translation shipped in locale/ for ``text``, or None.
+
+    Fixed labels (wrapper types, game names, ...) are in the gettext
+    catalogs already, so they never need the API.
+    """
+    with translation.override(language):
+        translated = translation.gettext(text)
+    return translated if translated != text else None
+
+
+def cached_translations(texts, language, format='text'):
+    """Translations already known for ``texts``: catalog, then memory, then the database."""
+    found = {}
+    missing = {}
+    catalog_hits = 0
+    for text in texts:
+        catalog = from_catalog(text, language) if format == 'text' else None
+        if catalog is not None:
+            found[text] = catalog
+            catalog_hits += 1
+            continue
+        source_hash = _hash(text, format)
+        cached = _memory.get(_memory_key(source_hash, language))
+        if cached is not None:
+            found[text] = cached
+        else:
+            missing[source_hash] = text
+    memory_hits = len(found) - catalog_hits
+
+    db_hits = 0
+    if missing:
+        for row in Translation.objects.filter(language=language, source_hash__in=list(missing)):
+            found[missing[row.source_hash]] = row.translated
+            _memory.set(_memory_key(row.source_hash, language), row.translated, _FOREVER)
+            db_hits += 1
+
+    _count(catalog_hits=catalog_hits, memory_hits=memory_hits, db_hits=db_hits, misses=len(missing) - db_hits)
+    return found
+
+
+def _store(translations, language, format='text'):
+    rows = []
+    for text, translated in translations.items():
+        source_hash = _hash(text, format)
+        _memory.set(_memory_key(source_hash, language), translated, _FOREVER)
+        rows.append(Translation(source_hash=source_hash, language=language, source=text, translated=translated))
+    try:
+        # Another request may have stored some of them meanwhile
+        Translation.objects.bulk_create(rows, ignore_conflicts=True)
+    except Exception as e:
+        logger.error(f"Failed to store translations: {str(e)}")
+
+
+def translate_many(texts, target_language, format='text', batch_size=None):
+    """
+    Translate a list of strings, returning the translations in the same order.
+
+    Known translations come from the gettext catalogs and the translation
+    cache; everything else is sent to the TRANSLATION_BACKEND in as few
+    requests as possible and cached for next time. Texts that can't be
+    translated come back as None, so a translation that happens to equal its
+    source (names, "OK", cognates) isn't mistaken for a failure. Pass
+    ``format='html'`` for markup, which Google then leaves intact (and
+    escapes the text around it). ``batch_size`` defaults to
+    TRANSLATION_BATCH_SIZE.
+    """
+    if target_language == settings.LANGUAGE_CODE:
+        return list(texts)
+
+    unique = list(dict.fromkeys(text for text in texts if text))
+    found = cached_translations(unique, target_language, format)
+
+    pending = [text for text in unique if text not in found]
+    batch_size = min(batch_size or getattr(settings, 'TRANSLATION_BATCH_SIZE', 100), MAX_BATCH_SIZE)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        _count(upstream_requests=1)
+        try:
+            translated = dict(zip(batch, get_backend().translate(batch, target_language, format)))
+        except Exception as e:
+            _count(upstream_errors=1)
+            logger.error(f"Translation to {target_language} failed: {str(e)}")
+            continue
+        _store(translated, target_language, format)
+        found.update(translated)
+
+    return [found.get(text) if text else text for text in texts]
+
+
+def translate(text, target_language):
+    """Translate a single string, see ``translate_many``; returns ``text`` itself if that fails."""
+    translated = translate_many([text], target_language)[0]
+    return text if translated is None else translated
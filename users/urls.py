@@ -21,12 +21,17 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('wraps/', views.wraps_view, name='wraps'),
     path('public_wraps/', views.public_wraps_view, name='public_wraps'),
+    path('public_wraps/feed/', views.public_wraps_feed, name='public_wraps_feed'),
     path('delete_account/', views.delete_account_view, name='delete_account'),
+    path('delete_account/status/<str:deletion_id>/', views.account_deletion_status, name='account_deletion_status'),
     path('profile/', views.profile_view, name='profile'),
     path('contact/', views.contact_view, name='contact'),
     path('games/', views.games_view, name='games'),
     path('analysis/', views.analyze_music_taste, name='analysis'),
+    path('analysis/status/', views.analysis_status, name='analysis_status'),
     path('handle-spotify-data/', views.handle_spotify_data, name='handle-spotify-data'),
+    path('snapshot-jobs/<int:job_id>/', views.snapshot_job_status, name='snapshot_job_status'),
     path('prepare-share-content/', views.prepare_share_content, name='prepare_share_content'),
+    path('spotify/metrics/', views.spotify_metrics, name='spotify_metrics'),
 
 ]
\ No newline at end of file
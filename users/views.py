@@ -2,31 +2,41 @@ import logging
 import os
 import random
 import secrets
-import requests
+from . import http_session
 import json
+import base64
 
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.hashers import make_password
 from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
 from urllib.parse import urlencode
 from .models import *
-from collections import Counter
+from . import account_deletion, music_analysis, ratelimit, tokens, translator
 
 from datetime import datetime
-from django.utils import timezone
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
 from django.contrib import messages
 from django.db import IntegrityError
+from django.db.models import Q
 from django.db import transaction  # Added for atomic transactions
 from django.core.exceptions import ValidationError  # Added for validation errors
-from django.core.cache import cache
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect, csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.utils.html import linebreaks
 
 logger = logging.getLogger(__name__)
 
+# Session key holding the id of the user's DashboardAggregate
+DASHBOARD_STATE_KEY = 'dashboard_state'
+# Raw payloads older sessions still carry, dropped on the next dashboard load
+LEGACY_DASHBOARD_SESSION_KEYS = [
+    'recent_tracks', 'top_tracks', 'top_artists', 'top_genres', 'top_playlists', 'top_albums'
+]
+
 def home_view(request):
     return render(request, 'home/home.html', {})
 
@@ -166,7 +176,7 @@ def spotify_callback(request):
 
     try:
         # Exchange authorization code for access token
-        token_response = requests.post(
+        token_response = http_session.post(
             'https://accounts.spotify.com/api/token',
             data={
                 'grant_type': 'authorization_code',
@@ -187,7 +197,7 @@ def spotify_callback(request):
         access_token = token_data['access_token']
 
         # Get Spotify user info
-        user_response = requests.get(
+        user_response = http_session.get(
             'https://api.spotify.com/v1/me',
             headers={'Authorization': f'Bearer {access_token}'}
         )
@@ -201,7 +211,7 @@ def spotify_callback(request):
         spotify_id = spotify_user['id']
 
         # Optional: Get playlists for verification
-        playlists_response = requests.get(
+        playlists_response = http_session.get(
             'https://api.spotify.com/v1/me/playlists',
             headers={'Authorization': f'Bearer {access_token}'}
         )
@@ -269,102 +279,35 @@ def spotify_callback(request):
 def dashboard(request):
     user = request.user
 
-    # Check if token needs refresh
-    if user.spotify_token_expires and timezone.now() >= user.spotify_token_expires:
-        access_token = refresh_spotify_token(user)
-        if not access_token:
-            messages.error(request, "Error refreshing Spotify connection. Please log in again.")
-            return redirect('logout')
-    else:
-        access_token = user.spotify_access_token
+    # Tokens close to expiry are renewed in the background, this only blocks once expired
+    access_token = tokens.get_access_token(user)
+    if not access_token:
+        messages.error(request, "Error refreshing Spotify connection. Please log in again.")
+        return redirect('logout')
 
     try:
-        headers = {'Authorization': f'Bearer {access_token}'}
-        base_url = 'https://api.spotify.com/v1'
-        # Fetch recently played tracks
-        recent_tracks_response = requests.get(
-            f'{base_url}/me/player/recently-played',
-            headers=headers,
-            params={'limit': 50}
-        )
-        recent_tracks = recent_tracks_response.json().get(
-            'items', []
-        ) if recent_tracks_response.status_code == 200 else []
-
-        # Fetch the user's playlists
-        playlist_response = requests.get(
-            f'{base_url}/me/playlists',
-            headers=headers,
-        )
-        top_playlists = playlist_response.json().get(
-            'items', []
-        ) if playlist_response.status_code == 200 else []
-
-        # Add duration to each playlist and retain other information
-        for playlist in top_playlists:
-            playlist_id = playlist['id']
-            # Fetch tracks for each playlist
-            playlist_duration_response = requests.get(
-                f'{base_url}/playlists/{playlist_id}/tracks',
-                headers=headers,
-            )
-
-            tracks = playlist_duration_response.json().get(
-                'items',[]
-            ) if playlist_duration_response.status_code == 200 else []
-
-            track_durations = []
-            for item in tracks:
-                track_durations.append(item['track']['duration_ms'])  # Duration in milliseconds
-
-            total_duration_minutes = sum(track_durations) / 1000 / 60  # Convert from ms to minutes
-            playlist['duration'] = total_duration_minutes  # Add the duration as a key in the playlist data
-
-        # Sort the playlists by total duration in descending order
-        ranked_playlists = sorted(top_playlists, key=lambda x: x['duration'], reverse=True)
-
-        # Display ranked playlists
-        for rank, playlist in enumerate(ranked_playlists, start=1):
-            print(f"Rank {rank}: {playlist['name']} - {playlist['duration']:.2f} minutes")
-
-        # Fetch top tracks and artists for different time ranges
-        top_tracks, top_artists, all_genres = {}, {}, []
-        for time_range in ['short_term', 'medium_term', 'long_term']:
-            top_tracks_response = requests.get(
-                f'{base_url}/me/top/tracks',
-                headers=headers,
-                params={'limit': 10, 'time_range': time_range}
-            )
-            top_artists_response = requests.get(
-                f'{base_url}/me/top/artists',
-                headers=headers,
-                params={'limit': 10, 'time_range': time_range}
-            )
-
-            top_tracks[time_range] = top_tracks_response.json().get(
-                'items', []
-            ) if top_tracks_response.status_code == 200 else []
-
-            top_artists[time_range] = top_artists_response.json().get(
-                'items', []
-            ) if top_artists_response.status_code == 200 else []
-
-            for artist in top_artists[time_range]:
-                all_genres.extend(artist.get('genres', []))
-
-        genre_counts = Counter(all_genres)
-        top_genres = genre_counts.most_common(10)
-
-        # Combine all top tracks from different time ranges
-        all_top_tracks = top_tracks['short_term'] + top_tracks['medium_term'] + top_tracks['long_term']
-        album_counts = Counter(track['album']['name'] for track in all_top_tracks)
-        most_listened_album = album_counts.most_common(1)
-
-        request.session['recent_tracks'] = recent_tracks
-        request.session['top_tracks'] = top_tracks
-        request.session['top_artists'] = top_artists['short_term']
-        request.session['top_genres'] = top_genres
-        request.session['top_playlists'] = ranked_playlists
+        # Everything shown here is precomputed, Spotify is only hit when it's stale
+        degraded = False
+        try:
+            if request.GET.get('refresh'):
+                aggregate = DashboardAggregate.refresh(user, access_token)
+            else:
+                aggregate = DashboardAggregate.get_fresh(user, access_token)
+        except IncompleteAggregateError as e:
+            # Shown as far as it goes but never stored, the next load tries Spotify again
+            aggregate, degraded = e.aggregate, True
+
+        recent_tracks = aggregate.recent_tracks
+        top_tracks = aggregate.top_tracks
+        top_artists = aggregate.top_artists['short_term']
+        top_genres = aggregate.genre_counts[:10]
+        ranked_playlists = aggregate.ranked_playlists
+
+        # The session only points at the aggregate, other views load what they need from it
+        if aggregate.id:
+            request.session[DASHBOARD_STATE_KEY] = aggregate.id
+        for key in LEGACY_DASHBOARD_SESSION_KEYS:
+            request.session.pop(key, None)
 
         context = {
             'lang': request.LANGUAGE_CODE,
@@ -373,30 +316,14 @@ def dashboard(request):
             'spotify_connected': True,
             'recent_tracks': recent_tracks,
             'top_tracks': top_tracks,
-            'top_artists': top_artists['short_term'],
+            'top_artists': top_artists,
             'top_genres': top_genres,
-            'top_playlists': ranked_playlists
+            'top_playlists': ranked_playlists,
+            'degraded': degraded,
         }
 
-        if most_listened_album:
-            # You can fetch the album details from Spotify using the album ID
-            album_response = requests.get(
-                'https://api.spotify.com/v1/search',
-                headers={'Authorization': f'Bearer {access_token}'},
-                params={'q': f'album:{most_listened_album[0][0]}', 'type': 'album', 'limit': 1}
-            )
-
-            if album_response.status_code == 200:
-                album_items = album_response.json().get('albums', {}).get('items', [])
-                if album_items:
-                    album_info = album_items[0]
-                    album_details = {
-                        'name': album_info['name'],
-                        'artist': album_info['artists'][0]['name'] if album_info['artists'] else None,
-                        'image_url': album_info['images'][0]['url'] if album_info['images'] else None,
-                    }
-                    context['most_listened_album_details'] = album_details
-                    request.session['top_albums'] = album_details
+        if aggregate.top_album:
+            context['most_listened_album_details'] = aggregate.top_album
 
         return render(request, 'registered/dashboard.html', context)
 
@@ -408,25 +335,49 @@ def dashboard(request):
             'spotify_connected': False
         })
 
+def get_dashboard_state(request, *fields):
+    """
+    Load only the given DashboardAggregate fields for the dashboard state this
+    session points at. Returns None if the dashboard hasn't been loaded yet.
+    The aggregate must belong to the requesting user, so a stale or
+    carried-over session can't read someone else's.
+    """
+    state_id = request.session.get(DASHBOARD_STATE_KEY)
+    if state_id is None or not request.user.is_authenticated:
+        return None
+    return DashboardAggregate.objects.filter(id=state_id, user=request.user).values(*fields).first()
+
+# (key the template switches on, label shown), indexed by the ?game= parameter
+GAMES = [
+    ('top_track', _('Guess Top Track')),
+    ('top_album', _('Guess Top Album')),
+    ('artist', _('Guess Artist')),
+]
+
+
 def games_view(request):
     theme = request.session.get('theme', 'light')  # Default to light mode
     selected_game = int(request.GET.get('game', '0'))  # Retrieve the selected game
-    game_type = ["Guess Top Track", "Guess Top Album", "Guess Artist"][selected_game]
+    game, game_type = GAMES[selected_game]
+
+    state = get_dashboard_state(request, 'top_tracks', 'top_artists', 'top_album')
+    if not state:
+        return redirect('dashboard')
 
-    top_tracks = random.choice(request.session.get('top_tracks', {})['short_term'])
-    top_artists = random.choice(request.session.get('top_artists', {}))
+    # Pick from the top ten so the game stays guessable
+    top_tracks = random.choice(state['top_tracks']['short_term'][:10])
+    top_artists = random.choice(state['top_artists']['short_term'][:10])
     language = request.session.get('django_language', settings.LANGUAGE_CODE)
-    if language == "es":
-        game_type = translate_to_spanish(game_type)
-    elif language == "fr":
-        game_type = translate_to_french(game_type)
+    with translation.override(language):
+        game_type = str(game_type)
 
     context = {
         'theme': theme,
         'language': language,
         'top_tracks': top_tracks,
         'top_artists': top_artists,
-        'top_albums': request.session.get('top_albums', {}),
+        'top_albums': state['top_album'] or {},
+        'game': game,
         'game_type': game_type,
     }
     return render(request, 'users/games.html', context)
@@ -435,8 +386,7 @@ def profile_view(request):
     theme = request.session.get('theme', 'light')  # Default to light mode
     if request.method == 'POST':
         if 'delete_account' in request.POST:
-            request.user.delete()
-            return redirect('home')
+            return delete_account_view(request)
         # add in whatever other stuff the profile view will have
 
     return render(request, 'users/profile.html', {'form': [], 'theme': theme})
@@ -473,82 +423,162 @@ def logout_view(request):
 
 def fetch_wraps(request, data_entries):
     wraps = []
-    for entry in data_entries:
+    for entry in prefetch_wraps(data_entries):
         wrap_data = {
-            'type': dict(SpotifyData.WRAPPER_TYPES).get(entry.wrapper_type, entry.wrapper_type),
+            'type': entry.get_wrapper_type_display(),
+            'wrapper_type': entry.wrapper_type,
             'created_at': entry.created_at,  # Add creation date
             'username': entry.user.username,
         }
 
-        if entry.wrapper_type.startswith('TOP_TRACKS') or entry.wrapper_type == 'RECENTLY_PLAYED':
-            wrap_data['tracks'] = list(entry.tracks.all())
-
-        if entry.wrapper_type == 'TOP_ARTISTS':
-            wrap_data['artists'] = list(entry.artists.all())
-
-        if entry.wrapper_type == 'TOP_ALBUMS':
-            wrap_data['albums'] = list(entry.albums.all())
-
-        if entry.wrapper_type == 'TOP_GENRES':
-            wrap_data['genres'] = list(entry.genres.all())
-
-        if entry.wrapper_type == 'TOP_PLAYLISTS':
-            wrap_data['playlists'] = list(entry.playlists.all())
+        # A repeated capture shows the content of the snapshot it points at
+        content = entry.content
+        if content.has_payload():
+            wrap_data[content.relation] = content.payload_items()
+        elif content.relation:
+            wrap_data[content.relation] = list(getattr(content, content.relation).all())
 
         wraps.append(wrap_data)
 
+    # Labels are lazy, resolve them from the .mo catalog of the user's language
     language = request.session.get('django_language', settings.LANGUAGE_CODE)
-    if language == "es" or language == "fr":
+    with translation.override(language):
         for wrap in wraps:
-            if language == "es":
-                wrap['type'] = translate_to_spanish(wrap['type'])
-            elif language == "fr":
-                wrap['type'] = translate_to_french(wrap['type'])
+            wrap['type'] = str(wrap['type'])
 
     return wraps
 
+def user_wraps(user):
+    """All of the user's SpotifyData entries, newest first, with the author joined in."""
+    return SpotifyData.objects.filter(user=user).select_related('user').order_by('-created_at')
+
+
 @login_required
 def wraps_view(request):
     theme = request.session.get('theme', 'light')
     user = request.user
 
-    # Retrieve all SpotifyData entries for the user, sorted by creation date
+    wraps = fetch_wraps(request, user_wraps(user))
+    return render(request, 'users/wraps.html', {'wraps': wraps, 'theme': theme, 'lang': request.LANGUAGE_CODE})
+
+def encode_feed_cursor(entry):
+    """Opaque cursor pointing just past ``entry`` in the public feed."""
+    position = f'{entry.created_at.isoformat()}|{entry.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_feed_cursor(cursor):
+    """Turn a cursor back into (created_at, id), or None if it's malformed."""
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def public_feed(cursor=None):
+    """
+    Public wraps after ``cursor`` (from the start without one), newest first.
+
+    Keyset pagination on (created_at, id) walks spotifydata_public_feed_idx,
+    so every page costs the same however deep into the feed it is. Only the
+    columns fetch_wraps needs are loaded, with the author joined in; wraps
+    without a payload have their children prefetched by fetch_wraps.
+    """
     data_entries = SpotifyData.objects.filter(
-        user=user
-    ).prefetch_related('tracks', 'artists', 'albums', 'genres', 'playlists').order_by('-created_at')
+        is_public=True  # Only fetch public entries
+    ).select_related('user').only(
+        'id', 'wrapper_type', 'created_at', 'payload', 'payload_version', 'source', 'user__username'
+    ).order_by('-created_at', '-id')
+
+    position = decode_feed_cursor(cursor) if cursor else None
+    if position:
+        created_at, entry_id = position
+        # The redundant created_at bound gives the planner a range to seek
+        # to; the OR alone makes it walk the index from the newest wrap
+        data_entries = data_entries.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=entry_id),
+            created_at__lte=created_at
+        )
+    return data_entries
+
+
+def public_feed_page(cursor=None):
+    """One page of public wraps, newest first, and the cursor of the next page."""
+    page_size = getattr(settings, 'PUBLIC_FEED_PAGE_SIZE', 20)
+    data_entries = public_feed(cursor)
+
+    # One extra row tells us whether there is a next page
+    entries = list(data_entries[:page_size + 1])
+    next_cursor = encode_feed_cursor(entries[page_size - 1]) if len(entries) > page_size else None
+    return entries[:page_size], next_cursor
 
-    wraps = fetch_wraps(request, data_entries)
-    return render(request, 'users/wraps.html', {'wraps': wraps, 'theme': theme, 'lang': request.LANGUAGE_CODE})
 
 @login_required
 def public_wraps_view(request):
     theme = request.session.get('theme', 'light')
 
-    # Retrieve all public SpotifyData entries, sorted by creation date
-    data_entries = SpotifyData.objects.filter(
-        is_public=True  # Only fetch public entries
-    ).prefetch_related('tracks', 'artists', 'albums', 'genres', 'playlists').order_by('-created_at')
+    data_entries, next_cursor = public_feed_page(request.GET.get('cursor'))
 
     wraps = fetch_wraps(request, data_entries)
-    return render(request, 'users/public_wraps.html', {'wraps': wraps, 'theme': theme, 'lang': request.LANGUAGE_CODE})
+    return render(request, 'users/public_wraps.html', {
+        'wraps': wraps,
+        'next_cursor': next_cursor,
+        'theme': theme,
+        'lang': request.LANGUAGE_CODE
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def public_wraps_feed(request):
+    """JSON version of the public feed for infinite scroll; pass back next_cursor to continue."""
+    data_entries, next_cursor = public_feed_page(request.GET.get('cursor'))
+
+    wraps = []
+    for wrap in fetch_wraps(request, data_entries):
+        for relation in SpotifyData.RENDERED_FIELDS:
+            if relation in wrap:
+                wrap[relation] = [
+                    item if isinstance(item, dict) else SpotifyData.payload_item(relation, item)
+                    for item in wrap[relation]
+                ]
+        wraps.append(wrap)
+
+    return JsonResponse({'wraps': wraps, 'next_cursor': next_cursor})
 
 
 @login_required
 def delete_account_view(request):
     theme = request.session.get('theme', 'light')  # Default to light mode
     if request.method == 'POST':
-        SpotifyData.objects.filter(user=request.user).delete()
-        request.user.delete()
+        user = request.user
+        if account_deletion.is_large(user):
+            # Too many snapshots to delete within a request, carry on in the background
+            deletion_id = account_deletion.start(user)
+            logout(request)
+            return render(request, 'users/delete_account.html', {'theme': theme, 'deletion_id': deletion_id})
+
+        with transaction.atomic():
+            delete_account(user)
         return redirect('home')
     return render(request, 'users/delete_account.html', {'theme': theme})
 
 
+@require_http_methods(["GET"])
+def account_deletion_status(request, deletion_id):
+    """Progress of a background account deletion, polled by the delete_account page."""
+    progress = account_deletion.progress(deletion_id)
+    if progress is None:
+        return JsonResponse({'error': 'Deletion not found'}, status=404)
+    return JsonResponse(progress)
+
+
 def set_theme(request, theme):
     if theme in ['light', 'dark', 'color']:
         request.session['theme'] = theme
     return redirect(request.META.get('HTTP_REFERER', '/'))  # Redirect back to the page
 
-from django.utils import translation
 def set_language(request):
     if request.method == 'POST':
         print('Language Code:', request.POST.get('language', settings.LANGUAGE_CODE))
@@ -564,8 +594,9 @@ def set_language(request):
 def analyze_music_taste(request):
     theme = request.session.get('theme', 'light')
 
-    # Safely get top_tracks from session
-    all_top_tracks = request.session.get('top_tracks', {})
+    # Safely get top_tracks from the dashboard state
+    state = get_dashboard_state(request, 'top_tracks')
+    all_top_tracks = state['top_tracks'] if state else {}
     if not all_top_tracks or 'short_term' not in all_top_tracks:
         return render(request, 'users/analysis.html', {
             'theme': theme,
@@ -573,107 +604,55 @@ def analyze_music_taste(request):
         })
 
     top_tracks = all_top_tracks['short_term'][:5]
+    language = request.session.get('django_language', settings.LANGUAGE_CODE)
 
-    try:
-        import google.generativeai as genai
-
-        # Create cache key from track IDs
-        cache_key = f"music_analysis_{'_'.join([t.get('id', '') for t in top_tracks])}"
-
-        # Check cache first
-        cached_analysis = cache.get(cache_key)
-        language = request.session.get('django_language', settings.LANGUAGE_CODE)
-
-        if cached_analysis:
-
-            if language == "es":
-                cached_analysis = translate_to_spanish(cached_analysis)
-            elif language == "fr":
-                cached_analysis = translate_to_french(cached_analysis)
-
-            return render(request, 'users/analysis.html', {
-                'theme': theme,
-                'top_tracks': top_tracks,
-                'analysis': cached_analysis,
-            })
-
-        # Format track data
-        track_info = []
-        for track in top_tracks:
-            artists = ", ".join([artist['name'] for artist in track['artists']])
-            track_info.append(f"{track['name']} by {artists}")
-
-        tracks_text = "\n".join(track_info)
-
-        # Configure Gemini
-        genai.configure(api_key=settings.CLOUD_API_KEY)
-        model = genai.GenerativeModel('gemini-pro')
-
-        prompt = """Based on these songs:
-{}
+    # Served from the cache when ready, otherwise generated in the background
+    # while the page polls analysis_status
+    status, analysis = music_analysis.request_analysis(top_tracks, language)
+    if status == 'failed':
+        return render(request, 'users/analysis.html', {
+            'theme': theme,
+            'top_tracks': top_tracks,
+            'error': 'Unable to generate analysis at this time. Please try again later.'
+        })
 
-Generate a fun roughly-50-word personality analysis
-It should describe how someone who listens to this kind of music tends to act/think/dress.
-Keep it positive and playful, focusing on the overall vibe rather than specific songs.""".format(tracks_text)
+    return render(request, 'users/analysis.html', {
+        'theme': theme,
+        'top_tracks': top_tracks,
+        'analysis': analysis,
+        'pending': status == 'pending',
+    })
 
-        # Generate analysis
-        response = model.generate_content(prompt)
-        analysis = response.text
 
-        # Cache successful analysis
-        if analysis:
-            cache.set(cache_key, analysis, 60 * 60 * 24)
+@require_http_methods(["GET"])
+def analysis_status(request):
+    """Polled by the analysis page until the background generation is done."""
+    state = get_dashboard_state(request, 'top_tracks')
+    all_top_tracks = state['top_tracks'] if state else {}
+    if not all_top_tracks or 'short_term' not in all_top_tracks:
+        return JsonResponse({'error': 'No tracks found. Please connect to Spotify first.'}, status=404)
 
-        if language == "es":
-            analysis = translate_to_spanish(cached_analysis)
-        elif language == "fr":
-            analysis = translate_to_french(cached_analysis)
+    language = request.session.get('django_language', settings.LANGUAGE_CODE)
+    status, analysis = music_analysis.request_analysis(all_top_tracks['short_term'][:5], language)
 
-        return render(request, 'users/analysis.html', {
-            'theme': theme,
-            'top_tracks': top_tracks,
-            'analysis': analysis,
-        })
+    response = {'status': status}
+    if analysis:
+        response['html'] = linebreaks(analysis, autoescape=True)
+    return JsonResponse(response)
 
-    except Exception as e:
-        print(f"Analysis generation error: {str(e)}")  # For debugging
-        return render(request, 'users/analysis.html', {
-            'theme': theme,
-            'top_tracks': top_tracks,
-            'error': 'Unable to generate analysis at this time. Please try again later.'
-        })
+@user_passes_test(lambda user: user.is_staff)
+def spotify_metrics(request):
+    """Rate-limit scheduler queue depth and wait times, for staff."""
+    return JsonResponse(ratelimit.scheduler.metrics())
 
 def refresh_spotify_token(user):
     """
     Refresh the Spotify access token for a user.
     Returns the new access token if successful, None if failed.
+    Concurrent calls for the same user share a single refresh, see users.tokens.
     """
     try:
-        token_response = requests.post(
-            'https://accounts.spotify.com/api/token',
-            data={
-                'grant_type': 'refresh_token',
-                'refresh_token': user.spotify_refresh_token,
-                'client_id': settings.SPOTIFY_CLIENT_ID,
-                'client_secret': settings.SPOTIFY_CLIENT_SECRET
-            },
-            headers={'Content-Type': 'application/x-www-form-urlencoded'}
-        )
-
-        if token_response.status_code != 200:
-            logger.error(f"Failed to refresh token for user {user.id}")
-            return None
-
-        token_data = token_response.json()
-
-        # Update user's token information
-        success = user.set_spotify_tokens(
-            access_token=token_data['access_token'],
-            refresh_token=token_data.get('refresh_token', user.spotify_refresh_token),
-            expires_in=token_data['expires_in']
-        )
-
-        return token_data['access_token'] if success else None
+        return tokens.refresh(user)
 
     except Exception as e:
         logger.error(f"Error refreshing token for user {user.id}: {str(e)}")
@@ -699,23 +678,23 @@ def handle_spotify_data(request):
         logger.info(f"Received user: {user}")
 
         # Check if token needs refresh, similar to dashboard view
-        if user.spotify_token_expires and timezone.now() >= user.spotify_token_expires:
-            access_token = refresh_spotify_token(user)
-            if not access_token:
-                return JsonResponse({'error': 'Failed to refresh Spotify token'}, status=401)
-        else:
-            access_token = user.spotify_access_token
-
+        access_token = tokens.get_access_token(user)
         if not access_token:
             return JsonResponse({'error': 'No valid Spotify token found'}, status=401)
 
         if action == "saved":
-            # Save the data using the helper function from models.py
-            spotify_data = save_spotify_wrapper(
-                user=user,
-                access_token=access_token,
-                wrapper_type=wrapper_type
-            )
+            if wrapper_type not in dict(SpotifyData.WRAPPER_TYPES):
+                return JsonResponse({'error': 'Invalid wrapper type'}, status=400)
+
+            # Captures run on the snapshot_worker, the client polls snapshot_job_status
+            job = SnapshotJob.enqueue(user=user, wrapper_type=wrapper_type)
+            logger.info(f"Queued snapshot job {job.id}, Type: {wrapper_type}")
+
+            return JsonResponse({
+                'message': f'Queued {wrapper_type} data',
+                'job_id': job.id,
+                'status': job.status,
+            }, status=202)
         elif action == "deleted":
             created_at_str = data.get('created_at')
             try:
@@ -755,6 +734,22 @@ def handle_spotify_data(request):
         logger.error(f"Error saving/deleting Spotify data: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@login_required
+@require_http_methods(["GET"])
+def snapshot_job_status(request, job_id):
+    """Progress of a queued snapshot capture, polled by the dashboard after saving."""
+    job = SnapshotJob.objects.filter(id=job_id, user=request.user).first()
+    if not job:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+
+    return JsonResponse({
+        'job_id': job.id,
+        'wrapper_type': job.wrapper_type,
+        'status': job.status,
+        'data_id': job.spotify_data_id,
+        'error': job.error,
+    })
+
 @csrf_exempt
 def prepare_share_content(request):
     if request.method == 'POST':
@@ -766,16 +761,23 @@ def prepare_share_content(request):
             print(wrapper_type)
 
             # Fetch user data or context (example shown)
-            recent_tracks = request.session.get('recent_tracks', [])
-            top_tracks = request.session.get('top_tracks', {})
-            top_artists = request.session.get('top_artists', [])
-            top_albums = request.session.get('top_albums', {})
-            top_genres = request.session.get('top_genres', [])
-            top_playlists = request.session.get('top_playlists', [])
+            state = get_dashboard_state(
+                request, 'recent_tracks', 'top_tracks', 'top_artists',
+                'top_album', 'genre_counts', 'ranked_playlists'
+            )
+            if not state:
+                return JsonResponse({'error': 'No Spotify data loaded'}, status=400)
+
+            recent_tracks = state['recent_tracks']
+            top_tracks = state['top_tracks']
+            top_artists = state['top_artists']['short_term']
+            top_albums = state['top_album'] or {}
+            top_genres = state['genre_counts'][:10]
+            top_playlists = state['ranked_playlists']
 
             # Determine content based on wrapper type
             if wrapper_type == 'Recently Played':
-                shared_content = ', '.join(track['track']['name'] for track in recent_tracks)
+                shared_content = ', '.join(track['name'] for track in recent_tracks)
             elif wrapper_type in ['Short Term', 'Medium Term', 'Long Term']:
                 term = wrapper_type.lower().replace(' ', '_')
                 shared_content = ', '.join(track['name'] for track in top_tracks.get(term, []))
@@ -816,25 +818,9 @@ def translate_text(text, target_language):
     :param target_language: Target language code (e.g., 'es', 'fr')
     :return: Translated text
     """
-    try:
-        url = f"https://translation.googleapis.com/language/translate/v2"
-        params = {
-            'key': settings.CLOUD_API_KEY,
-            'q': text,
-            'target': target_language,
-            'format': 'text'  # or 'html' if you want to preserve HTML formatting
-        }
-
-        response = requests.post(url, params=params)
-        response.raise_for_status()
-
-        translated_text = response.json()['data']['translations'][0]['translatedText']
-        return translated_text
-
-    except Exception as e:
-        # Log the error or handle it appropriately
-        print(f"Translation error: {e}")
-        return text  # Return original text if translation fails
+    # Cached and served from the gettext catalogs where possible,
+    # returns the original text if translation fails
+    return translator.translate(text, target_language)
 
 
 def translate_to_spanish(text):